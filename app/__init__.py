@@ -1,9 +1,14 @@
+import os
+
 from dotenv import load_dotenv
 from flask import Flask
 from flask_cors import CORS
 
+from .commands import init_commands
 from .config.db import setup_db
+from .config.indexes import reconcile_indexes
 from .routes import init_routes
+from .utils.logger import logger
 
 load_dotenv()
 
@@ -16,7 +21,14 @@ def init_app():
                     "https://mind.miva.university"]}})
 
     setup_db()
+    if os.getenv("MONGO_SYNC_INDEXES", "true").lower() == "true":
+        try:
+            reconcile_indexes()
+        except Exception as e:
+            logger.error(f"Failed to reconcile MongoDB indexes: {str(e)}")
+
     init_routes(app)
+    init_commands(app)
 
     return app
 
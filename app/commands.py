@@ -0,0 +1,151 @@
+import json
+
+import click
+from flask.cli import AppGroup
+
+from .config.indexes import reconcile_indexes, verify_query_plans
+from .models import Grade, StudentStats, GradeDailyRollup
+from .utils.grading import GRADING_WORKER_CONCURRENCY, conversation_cache_key, evict_grading_result, grading_workers
+from .utils.metrics import parse_date
+from .utils.regrade import regrade_logs
+
+indexes_cli = AppGroup('indexes', help="Manage MongoDB indexes declared on the models.")
+students_cli = AppGroup('students', help="Maintain denormalized student data.")
+metrics_cli = AppGroup('metrics', help="Maintain pre-aggregated metrics.")
+grading_cli = AppGroup('grading', help="Run grading workers and batch jobs.")
+
+
+@indexes_cli.command('sync')
+@click.option('--drop-extra', is_flag=True, help="Drop indexes that are no longer declared on the models.")
+def sync_indexes(drop_extra):
+    """Create missing indexes and report stale ones."""
+    report = reconcile_indexes(drop_extra=drop_extra)
+    click.echo(json.dumps(report, indent=2))
+
+    failed = [name for name, result in report.items() if "error" in result]
+    if failed:
+        raise click.ClickException(f"Indexes could not be created on: {', '.join(failed)}")
+
+
+@indexes_cli.command('verify')
+def verify_indexes():
+    """Explain every known query shape and fail on collection scans."""
+    try:
+        plans = verify_query_plans()
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+
+    for name, stages in plans.items():
+        click.echo(f"{name}: {' > '.join(stages)}")
+
+
+@students_cli.command('backfill-stats')
+@click.option('--batch-size', default=500, show_default=True, help="Rows written per bulk write.")
+def backfill_student_stats(batch_size):
+    """Rebuild the student_stats collection from grades and sessions."""
+    written = StudentStats.rebuild(batch_size=batch_size)
+    click.echo(f"Rebuilt stats for {written} users")
+
+
+@metrics_cli.command('rebuild-rollups')
+def rebuild_grade_rollups():
+    """Rebuild the daily grade rollups from the grades collection."""
+    written = GradeDailyRollup.rebuild()
+    click.echo(f"Rebuilt {written} daily grade rollups")
+
+
+@grading_cli.command('worker')
+@click.option('--concurrency', type=int, default=None, help="Number of jobs processed in parallel.")
+def run_grading_worker(concurrency):
+    """Process queued grading jobs until interrupted."""
+    if concurrency:
+        grading_workers.concurrency = concurrency
+    grading_workers.start()
+    try:
+        grading_workers.join()
+    except KeyboardInterrupt:
+        click.echo("Stopping grading workers")
+        grading_workers.stop()
+
+
+@grading_cli.command('dedupe')
+@click.option('--dry-run', is_flag=True, help="List the duplicate grades without deleting them.")
+@click.option('--no-rebuild', is_flag=True, help="Skip rebuilding student stats and daily rollups afterwards.")
+def dedupe_grades(dry_run, no_rebuild):
+    """Keep the first grade of each conversation and delete the rest, so the unique index can be built."""
+    removed = Grade.remove_duplicate_conversations(dry_run=dry_run)
+    for row in removed:
+        click.echo(f"{'Would remove' if dry_run else 'Removed'} grade {row['_id']} of conversation "
+                   f"{row['conversation_id']} (kept {row['kept']})")
+    click.echo(f"{len(removed)} duplicate grades {'found' if dry_run else 'removed'}")
+
+    if removed and not dry_run and not no_rebuild:
+        StudentStats.rebuild()
+        GradeDailyRollup.rebuild()
+        click.echo("Rebuilt student stats and daily grade rollups")
+
+
+@grading_cli.command('evict-cache')
+@click.argument('key', required=False)
+@click.option('--conversation', 'conversation_id', default=None,
+              help="Evict the result cached for this conversation's logged transcript instead of a key.")
+@click.option('--mode', type=click.Choice(['single', 'per_criterion']), default=None,
+              help="Grading mode of the cached result; defaults to GRADING_MODE.")
+def evict_cached_result(key, conversation_id, mode):
+    """Remove a cached grading result so the next grade of the same request calls the model again."""
+    if bool(key) == bool(conversation_id):
+        raise click.UsageError("Pass either a cache KEY or --conversation")
+    if conversation_id:
+        key = conversation_cache_key(conversation_id, mode=mode)
+        if key is None:
+            raise click.ClickException(f"No conversation log for {conversation_id}")
+
+    if evict_grading_result(key):
+        click.echo(f"Evicted cached grading result {key}")
+    else:
+        click.echo(f"No cached grading result {key}")
+
+
+@click.command('regrade')
+@click.option('--case-study', 'case_study_id', default=None, help="Only regrade conversations of this case study.")
+@click.option('--since', default=None, help="Only conversations logged at or after this ISO-8601 date.")
+@click.option('--until', default=None, help="Only conversations logged at or before this ISO-8601 date.")
+@click.option('--concurrency', type=int, default=GRADING_WORKER_CONCURRENCY, show_default=True,
+              help="Conversations graded in parallel.")
+@click.option('--rpm', type=float, default=60, show_default=True,
+              help="Cap on model requests per minute for regrades, shared by all regrade runs; 0 for no cap "
+                   "beyond GRADING_RPM.")
+@click.option('--batch-size', type=int, default=50, show_default=True,
+              help="Conversations graded and written per checkpoint.")
+@click.option('--run-id', default=None, help="Checkpoint name; defaults to one derived from the filters and prompt.")
+@click.option('--restart', is_flag=True,
+              help="Discard the checkpoint and scan from the start, e.g. to retry failed conversations.")
+@click.option('--force', is_flag=True,
+              help="Also regrade conversations already graded under the current prompt, bypassing the result cache.")
+@click.option('--no-rebuild', is_flag=True, help="Skip rebuilding student stats and daily rollups afterwards.")
+def regrade(case_study_id, since, until, concurrency, rpm, batch_size, run_id, restart, force, no_rebuild):
+    """Regrade logged conversations under the current grading prompt, resuming from the last checkpoint."""
+    try:
+        since, until = parse_date(since), parse_date(until)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+    def report(checkpoint, rate, eta):
+        eta_text = f"{eta / 60:.1f} min" if eta is not None else "unknown"
+        click.echo(f"{checkpoint.processed}/{checkpoint.total} processed, {checkpoint.regraded} regraded, "
+                   f"{checkpoint.skipped} skipped, {checkpoint.failed} failed | "
+                   f"{rate * 60:.1f}/min, ETA {eta_text}")
+
+    checkpoint = regrade_logs(case_study_id=case_study_id, since=since, until=until, concurrency=concurrency,
+                              rpm=rpm, batch_size=batch_size, run_id=run_id, restart=restart, force=force,
+                              rebuild=not no_rebuild, on_progress=report)
+    click.echo(f"Run {checkpoint.run_id} finished: {checkpoint.regraded} regraded, {checkpoint.skipped} skipped, "
+               f"{checkpoint.failed} failed")
+
+
+def init_commands(app):
+    app.cli.add_command(indexes_cli)
+    app.cli.add_command(students_cli)
+    app.cli.add_command(metrics_cli)
+    app.cli.add_command(grading_cli)
+    app.cli.add_command(regrade)
@@ -0,0 +1,110 @@
+from bson import ObjectId
+
+from ..models import User, Session, Grade, ConversationLog, CaseStudy, CaseStudyAvatar, UserRole, StudentStats, \
+    GradeDailyRollup, GradingJob, JobStatus, ConversationPayload, JobClaim, GradingResult, \
+    GradeVersion, RegradeCheckpoint, RateLimitBucket
+from ..utils.logger import logger
+
+INDEXED_MODELS = [User, CaseStudyAvatar, CaseStudy, Grade, ConversationLog, Session, StudentStats, GradeDailyRollup,
+                  GradingJob, JobClaim, GradingResult, ConversationPayload, GradeVersion, RegradeCheckpoint,
+                  RateLimitBucket]
+
+
+def reconcile_indexes(drop_extra: bool = False) -> dict:
+    """
+    Create every index declared in the model `meta` and report indexes that exist in the
+    database but are no longer declared. Extra indexes are only dropped when `drop_extra` is set.
+    A model whose indexes fail to build, e.g. a unique index over duplicate data, is reported with its
+    "error" and the remaining models are still reconciled.
+    """
+    report = {}
+    for model in INDEXED_MODELS:
+        collection = model._get_collection()
+        try:
+            model.ensure_indexes()
+        except Exception as e:
+            logger.error(f"Failed to create indexes on {collection.name}: {str(e)}")
+            report[collection.name] = {"error": str(e)}
+            continue
+
+        extra = model.compare_indexes().get('extra', [])
+        if extra and drop_extra:
+            for name, info in collection.index_information().items():
+                if name != '_id_' and list(info['key']) in extra:
+                    collection.drop_index(name)
+                    logger.info(f"Dropped stale index {name} on {collection.name}")
+
+        report[collection.name] = {
+            "indexes": sorted(collection.index_information().keys()),
+            "extra": extra if not drop_extra else [],
+        }
+        logger.info(f"Indexes reconciled for {collection.name}")
+
+    return report
+
+
+def known_query_shapes():
+    """
+    The hot query shapes served by the API, with placeholder values.
+    Each entry is (name, queryset) so the plan can be explained against the real collection.
+    """
+    oid = ObjectId()
+    return [
+        ("users.by_email", User.objects(email="plan@check.local")),
+        ("users.students", User.objects(role=UserRole.STUDENT).order_by('name')),
+        ("sessions.active_by_email", Session.objects(user_email="plan@check.local", is_active=True)),
+        ("sessions.by_case_study", Session.objects(case_study_id=str(oid), start_time__gte=oid.generation_time)),
+        ("grades.by_user", Grade.objects(user=oid).order_by('-timestamp', '-id')),
+        ("grades.by_user_case_study", Grade.objects(user=oid, case_study=oid).order_by('-timestamp')),
+        ("grades.by_case_study", Grade.objects(case_study=oid, timestamp__gte=oid.generation_time)),
+        ("grades.recent", Grade.objects(timestamp__gte=oid.generation_time).order_by('-timestamp')),
+        ("grades.by_conversation_id", Grade.objects(conversation_id="plan-check")),
+        ("conversation_logs.by_conversation_id", ConversationLog.objects(conversation_id="plan-check")),
+        ("conversation_logs.by_user_case_study", ConversationLog.objects(user=oid, case_study=oid)),
+        ("conversation_logs.by_case_study", ConversationLog.objects(case_study=oid, timestamp__gte=oid.generation_time)),
+        ("conversation_logs.regrade_stream", ConversationLog.objects(id__gt=oid).order_by('id')),
+        ("student_stats.listing", StudentStats.objects(role=UserRole.STUDENT).order_by('user')),
+        ("student_stats.by_assessment_date", StudentStats.objects(
+            role=UserRole.STUDENT, last_assessment_date__gte=oid.generation_time)),
+        ("student_stats.by_case_study", StudentStats.objects(case_studies=oid)),
+        ("grade_daily_rollups.by_day", GradeDailyRollup.objects(day__gte=oid.generation_time)),
+        ("grade_daily_rollups.by_case_study", GradeDailyRollup.objects(case_study=oid, day__gte=oid.generation_time)),
+        ("grading_jobs.claimable", GradingJob.objects(
+            status__in=[JobStatus.QUEUED, JobStatus.RUNNING],
+            visible_at__lte=oid.generation_time
+        ).order_by('visible_at')),
+        ("job_claims.by_key", JobClaim.objects(key="plan-check")),
+        ("grading_results.by_key", GradingResult.objects(key="plan-check")),
+        ("grade_versions.by_conversation_id", GradeVersion.objects(conversation_id="plan-check").order_by('version')),
+        ("conversation_payloads.by_conversation_id", ConversationPayload.objects(conversation_id="plan-check")),
+        ("conversation_payloads.lru", ConversationPayload.objects.order_by('last_accessed').limit(1)),
+        ("rate_limit_buckets.by_key", RateLimitBucket.objects(key="plan-check")),
+    ]
+
+
+def _plan_stages(plan):
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan['stage']
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _plan_stages(item)
+
+
+def verify_query_plans() -> dict:
+    """
+    Run `explain()` on every known query shape and fail if any winning plan is a COLLSCAN.
+    """
+    plans = {}
+    for name, queryset in known_query_shapes():
+        explanation = queryset.explain()
+        winning_plan = explanation.get('queryPlanner', {}).get('winningPlan', {})
+        plans[name] = list(_plan_stages(winning_plan))
+
+    collection_scans = [name for name, stages in plans.items() if 'COLLSCAN' in stages]
+    if collection_scans:
+        raise RuntimeError(f"Query shapes without index support (COLLSCAN): {', '.join(collection_scans)}")
+
+    return plans
@@ -1,14 +1,26 @@
 # models.py
 
+import os
 from datetime import datetime, timezone
 from enum import Enum
 from typing import Optional, Dict, List
 
 from mongoengine import Document, StringField, DateTimeField, EmailField, ReferenceField, IntField, DictField, \
-    ListField, BooleanField, EmbeddedDocument, EmbeddedDocumentField, EnumField
-from pydantic import BaseModel, Field
+    ListField, BooleanField, EmbeddedDocument, EmbeddedDocumentField, EnumField, ObjectIdField, FloatField
+from pymongo import ReplaceOne
+from pydantic import BaseModel, Field, field_validator
 
 from app.utils.auth import hash_password
+from app.utils.cache import TTLCache
+
+# Criteria scored individually by the grader, in prompt order.
+SCORE_CRITERIA = ("critical_thinking", "comprehension", "communication")
+
+# In-process cache of user records keyed by email, used on the authentication path.
+user_cache = TTLCache(
+    maxsize=int(os.getenv("USER_CACHE_SIZE", 2048)),
+    ttl=float(os.getenv("USER_CACHE_TTL", 60))
+)
 
 
 class PerformanceItem(BaseModel):
@@ -21,6 +33,65 @@ class PerformanceItem(BaseModel):
     description: str = Field(..., min_length=1)
 
 
+class IndividualScores(BaseModel):
+    """
+    Per criterion 0-100 scores returned by the grader. Every criterion is required; fractional scores are rounded.
+    """
+    critical_thinking: int = Field(..., ge=0, le=100)
+    comprehension: int = Field(..., ge=0, le=100)
+    communication: int = Field(..., ge=0, le=100)
+
+    @field_validator("critical_thinking", "comprehension", "communication", mode="before")
+    @classmethod
+    def round_score(cls, value):
+        return round(value) if isinstance(value, float) else value
+
+
+class PerformanceSummary(BaseModel):
+    strengths: List[PerformanceItem] = []
+    weaknesses: List[PerformanceItem] = []
+
+
+class CriterionAssessment(BaseModel):
+    """
+    Response of a single-criterion grading call.
+    """
+    score: int = Field(..., ge=0, le=100)
+    justification: str = ""
+
+    @field_validator("score", mode="before")
+    @classmethod
+    def round_score(cls, value):
+        return round(value) if isinstance(value, float) else value
+
+
+class FeedbackSummary(BaseModel):
+    """
+    Response of the feedback summary call in per-criterion grading, which carries no scores.
+    """
+    overall_summary: str = Field(..., min_length=1)
+    performance_summary: PerformanceSummary = PerformanceSummary()
+
+
+class GradingReport(BaseModel):
+    """
+    Structured grading response of the model. The summary and scores are required, so a truncated or unrelated
+    object fails validation instead of becoming a zero grade; justifications and feedback items default to empty.
+    Example:
+        GradingReport.model_validate(json.loads(response_text)).model_dump()
+    """
+    overall_summary: str = Field(..., min_length=1)
+    final_score: int = Field(..., ge=0, le=100)
+    individual_scores: IndividualScores
+    individual_score_justifications: Dict[str, str] = {}
+    performance_summary: PerformanceSummary = PerformanceSummary()
+
+    @field_validator("final_score", mode="before")
+    @classmethod
+    def round_score(cls, value):
+        return round(value) if isinstance(value, float) else value
+
+
 class PerformanceItemDocument(EmbeddedDocument):
     title = StringField(required=True, max_length=200)
     description = StringField(required=True)
@@ -45,7 +116,12 @@ class User(Document):
     date_added = DateTimeField(default=datetime.now(timezone.utc))
     date_updated = DateTimeField()
 
-    meta = {'collection': 'users'}
+    meta = {
+        'collection': 'users',
+        'indexes': [
+            ('role', 'name'),
+        ]
+    }
 
     @classmethod
     def find_by_email(cls, email: str) -> Optional["User"]:
@@ -54,6 +130,28 @@ class User(Document):
         """
         return cls.objects(email=email).first()
 
+    @classmethod
+    def find_cached_by_email(cls, email: str) -> Optional["User"]:
+        """
+        Find a user by email, serving repeated lookups from the in-process user cache.
+        The raw document is cached so every caller gets its own User instance.
+        """
+        son = user_cache.get(email)
+        if son is not None:
+            return cls._from_son(son)
+
+        user = cls.find_by_email(email)
+        if user:
+            user_cache.set(email, user.to_mongo().to_dict())
+        return user
+
+    @classmethod
+    def invalidate_cache(cls, email: str):
+        """
+        Drop a user's cached record so the next lookup reads it from the database.
+        """
+        user_cache.invalidate(email)
+
     @classmethod
     def create(cls, **kwargs) -> "User":
         """
@@ -99,8 +197,25 @@ class Grade(Document):
     performance_summary = DictField(field=ListField(EmbeddedDocumentField(PerformanceItemDocument)))
     conversation_id = StringField(required=True)
     timestamp = DateTimeField(default=datetime.now(timezone.utc))
-
-    meta = {'collection': 'grades'}
+    # Bumped each time the conversation is regraded; earlier versions are kept in GradeVersion
+    version = IntField(default=1)
+    prompt_version = StringField()
+    model = StringField()
+    input_tokens = IntField()
+    output_tokens = IntField()
+    # Seconds spent in each grading stage, e.g. {"fetch_conversation": 0.41, "infer": 6.2, "parse": 0.002}
+    stage_timings = DictField()
+
+    meta = {
+        'collection': 'grades',
+        'indexes': [
+            ('user', '-timestamp', '-id'),
+            ('user', 'case_study', '-timestamp'),
+            ('case_study', '-timestamp'),
+            '-timestamp',
+            {'fields': ['conversation_id'], 'unique': True},
+        ]
+    }
 
     @classmethod
     def create_grade(
@@ -112,6 +227,11 @@ class Grade(Document):
             individual_scores: Dict[str, int],
             performance_summary: Dict[str, List[dict]],
             case_study: CaseStudy = None,
+            prompt_version: str = None,
+            model: str = None,
+            input_tokens: int = None,
+            output_tokens: int = None,
+            stage_timings: Dict[str, float] = None,
     ) -> "Grade":
         """
         Create and save a new grade entry.
@@ -136,9 +256,16 @@ class Grade(Document):
             final_score=final_score,
             individual_scores=individual_scores,
             performance_summary=processed_performance_summary,
-            timestamp=datetime.now(timezone.utc)
+            timestamp=datetime.now(timezone.utc),
+            prompt_version=prompt_version,
+            model=model,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            stage_timings=stage_timings or {}
         )
         grade.save()
+        StudentStats.record_grade(user, case_study, final_score, grade.timestamp)
+        GradeDailyRollup.record_grade(case_study, final_score, individual_scores, grade.timestamp)
         return grade
 
     @classmethod
@@ -148,6 +275,80 @@ class Grade(Document):
         """
         return cls.objects(conversation_id=conversation_id).first()
 
+    @classmethod
+    def remove_duplicate_conversations(cls, dry_run: bool = False) -> List[dict]:
+        """
+        Keep the first grade of each conversation (by timestamp, then _id) and delete the others, so the
+        unique conversation_id index can be built. Returns the removed grades as
+        {"_id", "conversation_id", "kept"} rows; nothing is deleted with `dry_run`.
+        """
+        groups = cls._get_collection().aggregate([
+            {"$sort": {"timestamp": 1, "_id": 1}},
+            {"$group": {"_id": "$conversation_id", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}},
+        ], allowDiskUse=True)
+        removed = [
+            {"_id": grade_id, "conversation_id": group["_id"], "kept": group["ids"][0]}
+            for group in groups for grade_id in group["ids"][1:]
+        ]
+        if removed and not dry_run:
+            cls._get_collection().delete_many({"_id": {"$in": [row["_id"] for row in removed]}})
+        return removed
+
+    @classmethod
+    def summary_for_student(cls, user: User, limit: Optional[int] = None) -> dict:
+        """
+        Per case study grade series and session count for one student, in a single round trip.
+        Grades are matched on the student's index and their sessions are unioned into the same pipeline.
+        Grades are returned oldest first; with `limit`, only the most recent `limit` of each case study.
+        Raises ValueError when `limit` is given but isn't positive.
+        """
+        if limit is not None and limit < 1:
+            raise ValueError(f"limit must be at least 1, got {limit}")
+        # Pushed newest first, so the slice keeps the latest grades; reversed to oldest first either way
+        latest = {"$slice": ["$grades", limit]} if limit else "$grades"
+        series = [
+            {"$match": {"_session": {"$exists": False}}},
+            {"$sort": {"timestamp": -1}},
+            {
+                "$group": {
+                    "_id": "$case_study",
+                    "grades": {"$push": {"final_score": "$final_score", "timestamp": "$timestamp"}},
+                }
+            },
+            {
+                "$project": {
+                    "grades": {"$reverseArray": latest},
+                }
+            },
+        ]
+
+        result = list(cls._get_collection().aggregate([
+            {"$match": {"user": user.id}},
+            {"$project": {"case_study": 1, "final_score": 1, "timestamp": 1}},
+            {
+                "$unionWith": {
+                    "coll": Session._get_collection_name(),
+                    "pipeline": [
+                        {"$match": {"user_email": user.email}},
+                        {"$project": {"_id": 0, "_session": {"$literal": True}}},
+                    ]
+                }
+            },
+            {
+                "$facet": {
+                    "grades": series,
+                    "sessions": [{"$match": {"_session": True}}, {"$count": "count"}],
+                }
+            },
+        ]))
+
+        facets = result[0] if result else {"grades": [], "sessions": []}
+        return {
+            "grades": facets["grades"],
+            "sessions_count": facets["sessions"][0]["count"] if facets["sessions"] else 0,
+        }
+
     @classmethod
     def find_grade_by_user_email(cls, user_email: str, case_study_id: Optional[str] = None) -> "Grade":
         # Find the user first
@@ -186,7 +387,15 @@ class ConversationLog(Document):
     transcript = ListField(DictField())
     timestamp = DateTimeField(default=datetime.now(timezone.utc))
 
-    meta = {'collection': 'conversation_logs'}
+    meta = {
+        'collection': 'conversation_logs',
+        'indexes': [
+            'conversation_id',
+            ('user', 'case_study'),
+            ('case_study', '-timestamp'),
+            '-timestamp',
+        ]
+    }
 
     @classmethod
     def create_log(
@@ -231,7 +440,31 @@ class Session(Document):
     transcript = ListField(DictField(), default=[])
     last_activity = DateTimeField()
 
-    meta = {'collection': 'sessions'}
+    meta = {
+        'collection': 'sessions',
+        'indexes': [
+            ('user_email', 'is_active'),
+            ('case_study_id', 'start_time'),
+            'start_time',
+        ]
+    }
+
+    @classmethod
+    def create_session(cls, user: User, case_study_id: Optional[str] = None) -> "Session":
+        """
+        Start a new active session for a user and count it in their student stats.
+        """
+        now = datetime.now(timezone.utc)
+        session = cls(
+            user_email=user.email,
+            case_study_id=case_study_id,
+            is_active=True,
+            start_time=now,
+            last_activity=now
+        )
+        session.save()
+        StudentStats.record_session(user)
+        return session
 
     @classmethod
     def find_active_by_email(cls, email: str) -> Optional["Session"]:
@@ -252,3 +485,394 @@ class Session(Document):
             session.save()
             return session
         return None
+
+
+class StudentStats(Document):
+    """
+    Denormalized per-student listing row, kept up to date as grades and sessions are created.
+    Profile fields are copied from the user so the /students listing never joins other collections.
+    """
+    user = ReferenceField(User, required=True, unique=True)
+    email = StringField()
+    name = StringField()
+    role = EnumField(UserRole, default=UserRole.STUDENT)
+    title = StringField()
+    department = StringField()
+    total_grades = IntField(default=0)
+    score_sum = IntField(default=0)
+    total_sessions = IntField(default=0)
+    last_assessment_date = DateTimeField()
+    last_case_study = ObjectIdField()
+    case_studies = ListField(ObjectIdField())
+
+    meta = {
+        'collection': 'student_stats',
+        'indexes': [
+            ('role', 'user'),
+            ('role', 'last_assessment_date'),
+            'case_studies',
+        ]
+    }
+
+    @property
+    def average_score(self) -> Optional[float]:
+        return self.score_sum / self.total_grades if self.total_grades else None
+
+    @classmethod
+    def _profile_on_insert(cls, user: User) -> dict:
+        return {
+            "set_on_insert__email": user.email,
+            "set_on_insert__name": user.name,
+            "set_on_insert__role": user.role,
+            "set_on_insert__title": user.title,
+            "set_on_insert__department": user.department,
+        }
+
+    @classmethod
+    def record_grade(cls, user: User, case_study: Optional[CaseStudy], final_score: int, timestamp: datetime):
+        """
+        Atomically fold a new grade into the user's stats.
+        """
+        updates = {
+            "inc__total_grades": 1,
+            "inc__score_sum": int(final_score),
+            "max__last_assessment_date": timestamp,
+            **cls._profile_on_insert(user),
+        }
+        if case_study:
+            updates["set__last_case_study"] = case_study.id
+            updates["add_to_set__case_studies"] = case_study.id
+
+        cls.objects(user=user).update_one(upsert=True, **updates)
+
+    @classmethod
+    def record_session(cls, user: User):
+        """
+        Atomically count a new session in the user's stats.
+        """
+        cls.objects(user=user).update_one(upsert=True, inc__total_sessions=1, **cls._profile_on_insert(user))
+
+    @classmethod
+    def sync_profile(cls, user: User):
+        """
+        Copy the user's profile fields onto their stats row, creating it if needed.
+        """
+        cls.objects(user=user).update_one(
+            upsert=True,
+            set__email=user.email,
+            set__name=user.name,
+            set__role=user.role,
+            set__title=user.title,
+            set__department=user.department
+        )
+
+    @classmethod
+    def rebuild(cls, batch_size: int = 500) -> int:
+        """
+        Recompute every user's stats from the grades and sessions collections.
+        Used to backfill existing data; returns the number of rows written.
+        """
+        grade_stats = {
+            row["_id"]: row for row in Grade.objects.aggregate(
+                {"$sort": {"timestamp": 1}},
+                {
+                    "$group": {
+                        "_id": "$user",
+                        "total_grades": {"$sum": 1},
+                        "score_sum": {"$sum": "$final_score"},
+                        "last_assessment_date": {"$max": "$timestamp"},
+                        "last_case_study": {"$last": "$case_study"},
+                        "case_studies": {"$addToSet": "$case_study"},
+                    }
+                },
+                allowDiskUse=True
+            )
+        }
+        session_counts = {
+            row["_id"]: row["count"] for row in Session.objects.aggregate(
+                {"$group": {"_id": "$user_email", "count": {"$sum": 1}}},
+                allowDiskUse=True
+            )
+        }
+
+        collection = cls._get_collection()
+        operations = []
+        written = 0
+        for user in User.objects.only('id', 'email', 'name', 'role', 'title', 'department'):
+            grades = grade_stats.get(user.id, {})
+            row = cls(
+                user=user,
+                email=user.email,
+                name=user.name,
+                role=user.role,
+                title=user.title,
+                department=user.department,
+                total_grades=grades.get("total_grades", 0),
+                score_sum=grades.get("score_sum", 0),
+                total_sessions=session_counts.get(user.email, 0),
+                last_assessment_date=grades.get("last_assessment_date"),
+                last_case_study=grades.get("last_case_study"),
+                case_studies=[cs for cs in grades.get("case_studies", []) if cs is not None],
+            ).to_mongo().to_dict()
+            operations.append(ReplaceOne({"user": user.id}, row, upsert=True))
+
+            if len(operations) >= batch_size:
+                collection.bulk_write(operations, ordered=False)
+                written += len(operations)
+                operations = []
+
+        if operations:
+            collection.bulk_write(operations, ordered=False)
+            written += len(operations)
+
+        return written
+
+
+class GradeVersion(Document):
+    """
+    A superseded version of a grade, archived when its conversation is regraded.
+    """
+    grade = ObjectIdField(required=True)
+    conversation_id = StringField(required=True)
+    version = IntField(required=True)
+    prompt_version = StringField()
+    model = StringField()
+    input_tokens = IntField()
+    output_tokens = IntField()
+    stage_timings = DictField()
+    overall_summary = StringField()
+    final_score = IntField()
+    individual_scores = DictField()
+    performance_summary = DictField()
+    graded_at = DateTimeField()
+    archived_at = DateTimeField(default=lambda: datetime.now(timezone.utc))
+
+    meta = {
+        'collection': 'grade_versions',
+        'indexes': [
+            {'fields': ('conversation_id', 'version'), 'unique': True},
+        ]
+    }
+
+
+class RegradeCheckpoint(Document):
+    """
+    Progress of a `flask regrade` run. Conversation logs are processed in _id order, so `last_id`
+    is enough to resume a killed run where it stopped.
+    """
+    run_id = StringField(required=True, unique=True)
+    prompt_version = StringField()
+    filters = DictField()
+    last_id = ObjectIdField()
+    total = IntField(default=0)
+    processed = IntField(default=0)
+    regraded = IntField(default=0)
+    skipped = IntField(default=0)
+    failed = IntField(default=0)
+    started_at = DateTimeField(default=lambda: datetime.now(timezone.utc))
+    updated_at = DateTimeField(default=lambda: datetime.now(timezone.utc))
+    finished_at = DateTimeField()
+
+    meta = {
+        'collection': 'regrade_checkpoints'
+    }
+
+
+class GradeDailyRollup(Document):
+    """
+    Per day and case study sums and counts of grade scores, used by the time-series metrics.
+    Averages are derived on read, so rollups can be merged into weeks or months by adding them up.
+    """
+    day = DateTimeField(required=True)
+    case_study = ObjectIdField()
+    total_grades = IntField(default=0)
+    final_score_sum = IntField(default=0)
+    score_sums = DictField()
+    score_counts = DictField()
+
+    meta = {
+        'collection': 'grade_daily_rollups',
+        'indexes': [
+            {'fields': ('day', 'case_study'), 'unique': True},
+            ('case_study', 'day'),
+        ]
+    }
+
+    @staticmethod
+    def day_of(timestamp: datetime) -> datetime:
+        if timestamp.tzinfo:
+            timestamp = timestamp.astimezone(timezone.utc)
+        return datetime(timestamp.year, timestamp.month, timestamp.day)
+
+    @classmethod
+    def record_grade(cls, case_study: Optional[CaseStudy], final_score: int, individual_scores: Dict[str, int],
+                     timestamp: datetime):
+        """
+        Atomically fold a new grade into its day's rollup.
+        """
+        updates = {"inc__total_grades": 1, "inc__final_score_sum": int(final_score)}
+        for criterion in SCORE_CRITERIA:
+            score = (individual_scores or {}).get(criterion)
+            if isinstance(score, (int, float)):
+                updates[f"inc__score_sums__{criterion}"] = score
+                updates[f"inc__score_counts__{criterion}"] = 1
+
+        cls.objects(
+            day=cls.day_of(timestamp),
+            case_study=case_study.id if case_study else None
+        ).update_one(upsert=True, **updates)
+
+    @classmethod
+    def rebuild(cls):
+        """
+        Recompute every rollup from the grades collection, replacing the current contents.
+        """
+        score_sums = {criterion: {"$sum": f"$individual_scores.{criterion}"} for criterion in SCORE_CRITERIA}
+        score_counts = {
+            criterion: {"$sum": {"$cond": [{"$isNumber": f"$individual_scores.{criterion}"}, 1, 0]}}
+            for criterion in SCORE_CRITERIA
+        }
+
+        Grade._get_collection().aggregate([
+            {
+                "$group": {
+                    "_id": {
+                        "day": {
+                            "$dateFromParts": {
+                                "year": {"$year": "$timestamp"},
+                                "month": {"$month": "$timestamp"},
+                                "day": {"$dayOfMonth": "$timestamp"},
+                            }
+                        },
+                        "case_study": "$case_study",
+                    },
+                    "total_grades": {"$sum": 1},
+                    "final_score_sum": {"$sum": "$final_score"},
+                    **{f"sum_{criterion}": expr for criterion, expr in score_sums.items()},
+                    **{f"count_{criterion}": expr for criterion, expr in score_counts.items()},
+                }
+            },
+            {
+                "$project": {
+                    "_id": 0,
+                    "day": "$_id.day",
+                    "case_study": "$_id.case_study",
+                    "total_grades": 1,
+                    "final_score_sum": 1,
+                    "score_sums": {criterion: f"$sum_{criterion}" for criterion in SCORE_CRITERIA},
+                    "score_counts": {criterion: f"$count_{criterion}" for criterion in SCORE_CRITERIA},
+                }
+            },
+            {"$out": cls._get_collection_name()},
+        ], allowDiskUse=True)
+
+        return cls.objects.count()
+
+
+class JobStatus(str, Enum):
+    """
+    Enum for background job states.
+    """
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class GradingJob(Document):
+    """
+    A queued request to grade a conversation, processed by the grading worker pool.
+    A job is claimable while `visible_at` has passed: queued jobs wait for their (retry) time, and
+    running jobs become claimable again when their worker stops reporting progress.
+    """
+    conversation_id = StringField(required=True)
+    user_email = StringField(required=True)
+    case_study_id = StringField(required=True)
+    transcript = ListField(DictField(), default=None)
+    status = EnumField(JobStatus, default=JobStatus.QUEUED)
+    progress = StringField(default=None)
+    attempts = IntField(default=0)
+    max_attempts = IntField(default=3)
+    worker = StringField(default=None)
+    result = StringField(default=None)
+    error = StringField(default=None)
+    visible_at = DateTimeField(default=lambda: datetime.now(timezone.utc))
+    created_at = DateTimeField(default=lambda: datetime.now(timezone.utc))
+    updated_at = DateTimeField(default=lambda: datetime.now(timezone.utc))
+    finished_at = DateTimeField()
+
+    meta = {
+        'collection': 'grading_jobs',
+        'indexes': [
+            ('status', 'visible_at'),
+            'conversation_id',
+        ]
+    }
+
+
+class GradingResult(Document):
+    """
+    Structured grading result cached under the content address of its request
+    (normalised transcript, case description, model and prompt version).
+    """
+    key = StringField(required=True, unique=True)
+    model = StringField()
+    prompt_version = StringField()
+    result = StringField(required=True)
+    hits = IntField(default=0)
+    created_at = DateTimeField(default=lambda: datetime.now(timezone.utc))
+    last_hit_at = DateTimeField()
+
+    meta = {
+        'collection': 'grading_results'
+    }
+
+
+class JobClaim(Document):
+    """
+    Single-flight claim on a unit of work, e.g. grading one conversation. The unique `key` means only one
+    job at a time can own the work, across processes; other requests for it reuse the owning job.
+    """
+    key = StringField(required=True, unique=True)
+    job_id = ObjectIdField(required=True)
+    created_at = DateTimeField(default=lambda: datetime.now(timezone.utc))
+
+    meta = {
+        'collection': 'job_claims'
+    }
+
+
+class ConversationPayload(Document):
+    """
+    Cached ElevenLabs conversation payload. Only conversations in a terminal status are stored,
+    since their payload no longer changes. The payload is kept as its JSON text so arbitrary keys survive.
+    """
+    conversation_id = StringField(required=True, unique=True)
+    status = StringField()
+    payload = StringField(required=True)
+    size_bytes = IntField(default=0)
+    fetched_at = DateTimeField(default=lambda: datetime.now(timezone.utc))
+    last_accessed = DateTimeField(default=lambda: datetime.now(timezone.utc))
+
+    meta = {
+        'collection': 'conversation_payloads',
+        'indexes': [
+            'last_accessed',
+        ]
+    }
+
+
+class RateLimitBucket(Document):
+    """
+    Shared token bucket for an upstream API, refilled and spent atomically by every process.
+    `requests` and `tokens` are the capacity left as of `updated_at`; `grant` marks the caller of the last take.
+    """
+    key = StringField(required=True, unique=True)
+    requests = FloatField(default=0)
+    tokens = FloatField(default=0)
+    updated_at = DateTimeField(default=lambda: datetime.now(timezone.utc))
+    grant = StringField()
+
+    meta = {
+        'collection': 'rate_limit_buckets'
+    }
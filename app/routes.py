@@ -4,41 +4,108 @@ import os
 import jwt
 from bson import ObjectId
 from dotenv import load_dotenv
-from flask import jsonify, render_template, request, g, Response
+from flask import jsonify, render_template, request, g
+from mongoengine import Q
 
-from app.utils.jwt import token_required
-from .models import CaseStudy, ConversationLog, Grade, Session, User, UserRole, CaseStudyAvatar
+from app.utils.jwt import token_required, resolve_auth
+from .models import CaseStudy, ConversationLog, Grade, Session, User, UserRole, CaseStudyAvatar, StudentStats
+from .serializers import GradeRecord, CaseStudyRecord, avatar_records, load_case_study_ref, serialize_case_study, \
+    serialize_grade, serialize_grade_report, serialize_user
 from .services import create_user
 from .utils.auth import check_password, hash_password
 from .utils.cas_helper import validate_service_ticket
 from .utils.elevenlabs import get_signed_url, get_conversation
-from .utils.grading import grade_conversation
+from .utils.export import EXPORT_BATCH_SIZE, EXPORT_FORMATS, batched, export_response
+from .utils.grading import enqueue_grading, grading_queue
 from .utils.logger import logger
+from .utils.metrics import aggregate_metrics, grade_timeseries
+from .utils.pagination import paginate
 from .utils.perser import remove_none
+from .utils.prefetch import prefetch_references
+from .utils import telemetry
 
 load_dotenv()
 
 API_KEY = os.getenv('ELEVENLABS_API_KEY')
 
+STUDENT_EXPORT_COLUMNS = [
+    ("id", "ID"),
+    ("name", "Name"),
+    ("email", "Email"),
+    ("lastAssessmentDate", "Last Assessment Date"),
+    ("sessionsCompleted", "Sessions Completed"),
+    ("averageScore", "Average Score"),
+]
+
+GRADE_EXPORT_COLUMNS = [
+    ("id", "ID"),
+    ("student_id", "Student ID"),
+    ("student_email", "Student Email"),
+    ("case_study_id", "Case Study ID"),
+    ("conversation_id", "Conversation ID"),
+    ("timestamp", "Timestamp"),
+    ("final_score", "Final Score"),
+    ("critical_thinking", "Critical Thinking"),
+    ("comprehension", "Comprehension"),
+    ("communication", "Communication"),
+]
+
+
+def format_student_stats(row: dict) -> dict:
+    """
+    Format a raw student_stats document for the /students listing and exports.
+    """
+    total_grades = row.get('total_grades', 0)
+    average_score = row.get('score_sum', 0) / total_grades if total_grades else None
+    return {
+        "id": str(row.get('user')),
+        "email": row.get('email'),
+        "name": row.get('name'),
+        "role": row.get('role'),
+        "title": row.get('title'),
+        "department": row.get('department'),
+        "lastAssessmentDate": row.get('last_assessment_date'),
+        "sessionsCompleted": row.get('total_sessions', 0),
+        "averageScore": round(average_score, 2) if average_score is not None else 0
+    }
+
+
+def iter_grade_export_rows(grades):
+    """
+    Format raw grade documents for export, resolving student emails one batch at a time.
+    """
+    for batch in batched(grades):
+        user_ids = {grade.get('user') for grade in batch}
+        emails = {
+            user['_id']: user.get('email')
+            for user in User.objects(id__in=list(user_ids)).only('email').as_pymongo()
+        }
+        for grade in batch:
+            scores = grade.get('individual_scores') or {}
+            yield {
+                "id": str(grade['_id']),
+                "student_id": str(grade.get('user')),
+                "student_email": emails.get(grade.get('user')),
+                "case_study_id": str(grade['case_study']) if grade.get('case_study') else None,
+                "conversation_id": grade.get('conversation_id'),
+                "timestamp": grade['timestamp'].isoformat() if grade.get('timestamp') else None,
+                "final_score": grade.get('final_score'),
+                "critical_thinking": scores.get('critical_thinking'),
+                "comprehension": scores.get('comprehension'),
+                "communication": scores.get('communication'),
+            }
+
 
 def init_routes(app):
     @app.before_request
     def load_session():
-        auth_header = request.headers.get('Authorization')
-
-        if auth_header and auth_header.startswith('Bearer '):
-            token = auth_header.split(' ')[1]
-            try:
-                decoded = jwt.decode(token, os.getenv('JWT_SECRET'), algorithms=['HS256'])
-                user_email = decoded.get('email')
-
-                active_session = Session.find_active_by_email(user_email)
-                g.user_info = active_session
-            except Exception as e:
-                logger.error(f"Error loading session: {str(e)}")
-                return jsonify({"status": "error", "message": "Session has expired"}), 403
-        else:
-            g.user_info = None
+        # Decodes the token and resolves the user and active session once per request;
+        # token_required reuses the result from `g`.
+        try:
+            resolve_auth()
+        except Exception as e:
+            logger.error(f"Error loading session: {str(e)}")
+            return jsonify({"status": "error", "message": "Session has expired"}), 403
 
     @app.route('/')
     def index():
@@ -74,7 +141,7 @@ def init_routes(app):
 
             # Create or update the user's session with the case study information
             user_email = g.data.email
-            active_session = Session.find_active_by_email(user_email)
+            active_session = g.user_info
 
             if active_session:
                 # Update existing session with new conversation
@@ -83,14 +150,7 @@ def init_routes(app):
                 active_session.save()
             else:
                 # Create new session
-                session = Session(
-                    user_email=user_email,
-                    case_study_id=case_study_id if case_study_id else None,
-                    is_active=True,
-                    start_time=datetime.datetime.now(datetime.timezone.utc),
-                    last_activity=datetime.datetime.now(datetime.timezone.utc)
-                )
-                session.save()
+                Session.create_session(g.data, case_study_id if case_study_id else None)
 
             # Get the signed URL using the agent_id
             signed_url_text = get_signed_url(agent_id)
@@ -151,17 +211,11 @@ def init_routes(app):
     @app.route('/cas/logout')
     def cas_logout():
 
-        auth_header = request.headers.get('Authorization')
-        user_email = None
-
-        if auth_header and auth_header.startswith('Bearer '):
-            token = auth_header.split(' ')[1]
-            decoded = jwt.decode(token, os.getenv('JWT_SECRET'), algorithms=['HS256'])
-            user_email = decoded.get('email')
+        user_email = g.auth_claims.get('email') if g.auth_claims else None
 
         if user_email:
 
-            active_session = Session.find_active_by_email(user_email)
+            active_session = g.user_info
             if active_session:
                 Session.end_session(active_session.id)
 
@@ -255,6 +309,7 @@ def init_routes(app):
             # Update the user's password
             user.password = new_password
             user.save()
+            User.invalidate_cache(user.email)
             return jsonify({"status": "success", "message": "Password changed successfully"}), 200
         except Exception as e:
             logger.error(f"Error in change_password: {str(e)}")
@@ -276,22 +331,9 @@ def init_routes(app):
             if not user:
                 return jsonify({"status": "error", "message": "User not found"}), 404
 
-            now = datetime.datetime.now(datetime.timezone.utc).isoformat()
-            # Format the user data
-            formatted_user = {
-                "id": str(user.id),
-                "email": user.email,
-                "name": user.name,
-                "role": user.role,
-                "title": user.title,
-                "department": user.department,
-                "date_added": user.date_added.isoformat() if user.date_added else now,
-                "date_updated": user.date_updated.isoformat() if user.date_updated else now,
-            }
-
             return jsonify({
                 "status": "success",
-                "user": formatted_user
+                "user": serialize_user(user)
             })
 
         except Exception as e:
@@ -331,21 +373,13 @@ def init_routes(app):
                 user.department = data['department']
 
             user.save()
+            User.invalidate_cache(user.email)
+            StudentStats.sync_profile(user)
 
-            now = datetime.datetime.now(datetime.timezone.utc).isoformat()
             return jsonify({
                 "status": "success",
                 "message": "User updated successfully",
-                "user": {
-                    "id": str(user.id),
-                    "email": user.email,
-                    "name": user.name,
-                    "role": user.role,
-                    "title": user.title,
-                    "department": user.department,
-                    "date_added": user.date_added.isoformat() if user.date_added else now,
-                    "date_updated": user.date_updated.isoformat() if user.date_updated else now,
-                }
+                "user": serialize_user(user)
             })
 
         except Exception as e:
@@ -363,9 +397,10 @@ def init_routes(app):
             if not g.data:
                 return jsonify({"status": "error", "message": "User not authenticated"}), 401
 
-            # Get pagination parameters
+            # Get pagination parameters; `cursor` takes precedence over `page`
             page = int(request.args.get('page', 1))
             per_page = int(request.args.get('per_page', 10))
+            cursor = request.args.get('cursor')
 
             # Get filter parameters
             start_date = request.args.get('start_date')
@@ -378,168 +413,35 @@ def init_routes(app):
             export_filename = request.args.get('export_filename', 'students')
             export_mode = request.args.get('export_mode', 'page')
 
-            assessment_date_filter_pipeline = [
-                {
-                    "$match": {
-                        "$expr": {
-                            "$and": [
-                                {"$gte": ["$grades.last_assessment_date", datetime.datetime.fromisoformat(start_date)]},
-                                {"$lte": ["$grades.last_assessment_date", datetime.datetime.fromisoformat(end_date)]}
-                            ]
-                        }
-                    }
-                }
-            ] if start_date and end_date else []
-
-            case_study_id_filter_pipeline = [
-                {
-                    "$match": {
-                        "$expr": {
-                            "$eq": ["$grades.case_study", ObjectId(case_study_id)]
-                        }
-                    }
-                }
-            ] if case_study_id else []
+            stats = StudentStats.objects(role=UserRole.STUDENT)
+            if start_date and end_date:
+                stats = stats.filter(
+                    last_assessment_date__gte=datetime.datetime.fromisoformat(start_date),
+                    last_assessment_date__lte=datetime.datetime.fromisoformat(end_date)
+                )
+            if case_study_id:
+                stats = stats.filter(case_studies=ObjectId(case_study_id))
+            if q:
+                stats = stats.filter(Q(email__icontains=q) | Q(name__icontains=q))
 
-            search_filter_pipeline = [
-                {
-                    "$match": {
-                        "$expr": {
-                            "$or": [
-                                {"$regexMatch": {"input": '$email', "regex": q, "options": 'i'}},
-                                {"$regexMatch": {"input": '$name', "regex": q, "options": 'i'}},
-                            ]
-                        }
-                    }
-                }
-            ] if q else []
+            rows = stats.order_by('user').as_pymongo()
 
-            pagination_pipeline = [
-                {
-                    "$skip": (page - 1) * per_page
-                },
-                {
-                    "$limit": per_page
-                }
-            ] if per_page > 0 and page > 0 and export_mode == 'page' else []
-
-            def get_pipeline_stages(count=False):
-                return [
-                    {
-                        "$lookup": {
-                            "from": "grades",
-                            "let": {"userId": "$_id"},
-                            "pipeline": [
-                                {
-                                    "$match": {
-                                        "$expr": {
-                                            "$eq": ["$user", "$$userId"]
-                                        }
-                                    }
-                                },
-                                {
-                                    "$group": {
-                                        "_id": "$user",
-                                        "average_score": {"$avg": "$final_score"},
-                                        "last_assessment_date": {"$max": "$timestamp"},
-                                        "total_sessions": {"$sum": 1},
-                                        "case_study": {"$max": "$case_study"},
-                                    }
-                                }
-                            ],
-                            "as": "grades"
-                        }
-                    },
-                    {
-                        "$lookup": {
-                            "from": "sessions",
-                            "let": {"userEmail": "$email"},
-                            "pipeline": [
-                                {
-                                    "$match": {
-                                        "$expr": {
-                                            "$eq": ["$user_email", "$$userEmail"]
-                                        }
-                                    }
-                                },
-                                {
-                                    "$group": {
-                                        "_id": None,
-                                        "total_sessions": {"$count": {}},
-                                    }
-                                }
-                            ],
-                            "as": "sessions"
-                        }
-                    },
-                    {
-                        "$unwind": {
-                            "path": "$grades",
-                            "preserveNullAndEmptyArrays": True
-                        }
-                    },
-                    {
-                        "$unwind": {
-                            "path": "$sessions",
-                            "preserveNullAndEmptyArrays": True
-                        }
-                    },
-                    *assessment_date_filter_pipeline,
-                    *case_study_id_filter_pipeline,
-                    *search_filter_pipeline,
-                    *(pagination_pipeline if not count else []),
-                    {
-                        "$project": {
-                            "_id": 0,
-                            "id": "$_id",
-                            "email": 1,
-                            "name": 1,
-                            "role": 1,
-                            "title": 1,
-                            "department": 1,
-                            "last_assessment_date": "$grades.last_assessment_date",
-                            "total_sessions": "$sessions.total_sessions",
-                            "average_score": "$grades.average_score"
-                        }
-                    } if not count else {
-                        "$count": "count"
-                    }
-                ]
+            # Whole-cohort exports stream straight from the cursor without building the list first
+            if export_format in EXPORT_FORMATS and export_mode != 'page':
+                students = (format_student_stats(row) for row in rows.batch_size(EXPORT_BATCH_SIZE))
+                return export_response(export_format, export_filename, STUDENT_EXPORT_COLUMNS, students)
 
-            # Get all students from the database
-            # WARNING: we are not paginating the students here because we are not adding the filters
-            # to the query. This means that if we have a lot of students, this could be a performance issue.
-            students = User.objects(role=UserRole.STUDENT).aggregate(get_pipeline_stages())
+            next_cursor = None
+            if per_page > 0 and page > 0:
+                rows, next_cursor = paginate(rows, ['user'], per_page, page, cursor)
 
             # Format the student data
-            formatted_students = []
-            for student in students:
-                formatted_students.append({
-                    "id": str(student.get('id')),
-                    "email": student.get('email'),
-                    "name": student.get('name'),
-                    "role": student.get('role'),
-                    "title": student.get('title'),
-                    "department": student.get('department'),
-                    "lastAssessmentDate": student.get('last_assessment_date', None),
-                    "sessionsCompleted": student.get('total_sessions', 0),
-                    "averageScore": round(student.get('average_score', 0), 2) if student.get(
-                        'average_score') is not None else 0
-                })
+            formatted_students = [format_student_stats(row) for row in rows]
 
-            if export_format == 'csv':
-                # Create a CSV string from the user data
-                csv_data = "ID,Name,Email,Last Assessment Date,Sessions Completed,Average Score\n"
-                for student in formatted_students:
-                    csv_data += f"{student['id']},{student['name']},{student['email']},{student['lastAssessmentDate']},{student['sessionsCompleted']},{student['averageScore']}\n"
+            if export_format in EXPORT_FORMATS:
+                return export_response(export_format, export_filename, STUDENT_EXPORT_COLUMNS, formatted_students)
 
-                # Create a direct download response with the CSV data and appropriate headers
-                response = Response(csv_data, content_type="text/csv")
-                response.headers["Content-Disposition"] = f"attachment; filename={export_filename}.csv"
-
-                return response
-
-            total = User.objects(role=UserRole.STUDENT).aggregate(get_pipeline_stages(True)).to_list()
+            total = stats.count()
 
             return jsonify({
                 "status": "success",
@@ -547,10 +449,14 @@ def init_routes(app):
                 "meta": {
                     "page": page,
                     "per_page": per_page,
-                    "total": total[0].get('count') if len(total) > 0 else 0,
+                    "total": total,
+                    "next_cursor": next_cursor,
                 }
             })
 
+        except ValueError as e:
+            logger.error(f"Invalid parameters in get_students: {str(e)}")
+            return jsonify({"status": "error", "message": "Invalid query parameters"}), 400
         except Exception as e:
             logger.error(f"Error in get_students: {str(e)}")
             return jsonify({
@@ -572,26 +478,21 @@ def init_routes(app):
             if not student:
                 return jsonify({"status": "error", "message": "Student not found"}), 404
 
-            # Get grades for the student grouped by case study
-            student_grades = Grade.objects.aggregate(
-                {
-                    "$group": {
-                        "_id": "$case_study",
-                        "grades": {
-                            "$push": {
-                                "final_score": "$final_score",
-                                "timestamp": "$timestamp"
-                            }
-                        },
-                    }
-                }
-            )
+            # Optional cap on the number of grades returned per case study
+            limit = request.args.get('limit')
+            if limit is not None:
+                if not limit.isdigit() or int(limit) < 1:
+                    return jsonify({"status": "error", "message": "limit must be a positive integer"}), 400
+                limit = int(limit)
+
+            # Get grades for the student grouped by case study, plus their session count
+            summary = Grade.summary_for_student(student, limit)
 
             grades = [
                 {
                     "case_study_id": str(grade["_id"]),
                     "grades": grade["grades"]
-                } for grade in student_grades
+                } for grade in summary["grades"]
             ]
 
             # Format the student data
@@ -601,7 +502,7 @@ def init_routes(app):
                 "name": student.name,
                 "role": student.role,
                 "title": student.title,
-                "sessions_count": Session.objects(user_email=student.email).count(),
+                "sessions_count": summary["sessions_count"],
                 "case_studies_count": len(grades),
                 "grades": grades,
                 "department": student.department,
@@ -612,6 +513,9 @@ def init_routes(app):
                 "student": formatted_student
             })
 
+        except ValueError as e:
+            logger.error(f"Invalid parameters in get_student: {str(e)}")
+            return jsonify({"status": "error", "message": "Invalid query parameters"}), 400
         except Exception as e:
             logger.error(f"Error in get_student: {str(e)}")
             return jsonify({
@@ -625,7 +529,8 @@ def init_routes(app):
         if not g.data:
             return jsonify({"status": "error", "message": "User not authenticated"}), 401
 
-        conversation = get_conversation(conversation_id)
+        refresh = request.args.get('refresh', 'false').lower() == 'true'
+        conversation = get_conversation(conversation_id, refresh=refresh)
         return jsonify({"data": conversation})
 
     @app.route('/students/<student_id>/grades', methods=['GET'])
@@ -641,7 +546,7 @@ def init_routes(app):
             data = request.json
             transcript = data.get('transcripts')
             # Find the active session to get the case study information
-            active_session = Session.find_active_by_email(user_email)
+            active_session = g.user_info
             case_study_id = active_session.case_study_id if active_session else (request.args.get(
                 'case_study_id') or data.get('case_study_id'))
 
@@ -654,25 +559,18 @@ def init_routes(app):
                     "message": "Unable to grade: could not load case study information."
                 }), 404
 
-            # Grade the conversation, passing the case study if available
-            grading_result = grade_conversation(conversation_id, user_email, case_study, transcript)
+            # Queue the conversation for grading; progress is reported on /grade/jobs/<job_id>
+            job = enqueue_grading(conversation_id, user_email, case_study, transcript)
 
-            if grading_result is None:
-                return jsonify({
-                    "status": "error",
-                    "message": "Unable to grade: missing conversation transcripts"
-                })
-
-            # Grading means a session is completed
-            active_session = Session.find_active_by_email(user_email)
+            # Submitting for grading means a session is completed
             if active_session:
                 Session.end_session(active_session.id)
 
             return jsonify({
                 "status": "success",
-                "message": "Conversation graded.",
-                "grading_result": str(grading_result)
-            })
+                "message": "Conversation queued for grading.",
+                "job_id": str(job.id)
+            }), 202
         except Exception as e:
             # Log the error with traceback
             import traceback
@@ -682,51 +580,75 @@ def init_routes(app):
                 "message": "Unable to grade conversation. Please try again later"
             }), 500
 
+    @app.route('/grade/jobs/<job_id>', methods=['GET'])
+    @token_required
+    def get_grading_job(job_id):
+        """Get the status of a grading job"""
+        try:
+            if not g.data:
+                return jsonify({"status": "error", "message": "User not authenticated"}), 401
+
+            job = grading_queue.get(job_id)
+
+            if not job or (job.user_email != g.data.email and g.data.role not in ['admin', 'faculty']):
+                return jsonify({"status": "error", "message": "Grading job not found"}), 404
+
+            return jsonify({
+                "status": "success",
+                "job": {
+                    "id": str(job.id),
+                    "conversation_id": job.conversation_id,
+                    "status": job.status,
+                    "progress": job.progress,
+                    "attempts": job.attempts,
+                    "max_attempts": job.max_attempts,
+                    "error": job.error,
+                    "grading_result": job.result,
+                    "created_at": job.created_at.isoformat() if job.created_at else None,
+                    "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+                }
+            })
+
+        except Exception as e:
+            logger.error(f"Error in /grade/jobs/{job_id}: {str(e)}")
+            return jsonify({
+                "status": "error",
+                "message": "An error occurred while fetching the grading job"
+            }), 500
+
     @app.route('/grades', methods=['GET'])
     def get_user_grades():
 
-        auth_header = request.headers.get('Authorization')
-        user_email = None
-
-        if auth_header and auth_header.startswith('Bearer '):
-            token = auth_header.split(' ')[1]
-            decoded = jwt.decode(token, os.getenv('JWT_SECRET'), algorithms=['HS256'])
-            user_email = decoded.get('email')
+        user_email = g.auth_claims.get('email') if g.auth_claims else None
 
         if not user_email:
             return jsonify({"status": "error", "message": "User not authenticated"}), 401
         try:
-            user = User.find_by_email(user_email)
+            user = g.auth_user
             if not user:
                 return jsonify({"status": "error", "message": "User not found"}), 404
 
-            grades = Grade.find_grade_by_user_email(user_email)
+            grades = GradeRecord.project(Grade.find_grade_by_user_email(user_email))
 
-            formatted_grades = []
-            for grade in grades:
-                formatted_performance_summary = {}
-                for key, items in grade.performance_summary.items():
-                    formatted_items = []
-                    for item in items:
-                        formatted_items.append({
-                            "title": item.title,
-                            "description": item.description
-                        })
-                    formatted_performance_summary[key] = formatted_items
-
-                formatted_grades.append({
-                    "id": str(grade.id),
-                    "user_email": grade.user.email,
-                    "timestamp": grade.timestamp.isoformat(),
-                    "final_score": grade.final_score,
-                    "individual_scores": grade.individual_scores,
-                    "performance_summary": formatted_performance_summary,
-                    "conversation_id": grade.conversation_id
-                })
+            # Only paginate when asked to, so existing clients keep receiving every grade
+            per_page = int(request.args.get('per_page', 0))
+            page = int(request.args.get('page', 1))
+            cursor = request.args.get('cursor')
+            next_cursor = None
+            if per_page > 0:
+                grades, next_cursor = paginate(grades, ['-timestamp', '-id'], per_page, page, cursor)
+
+            # Every grade belongs to the authenticated user, so their email needs no lookup
+            formatted_grades = [serialize_grade(GradeRecord(raw), user.email) for raw in grades]
 
             return jsonify({
                 "status": "success",
-                "grades": formatted_grades
+                "grades": formatted_grades,
+                "meta": {
+                    "page": page,
+                    "per_page": per_page,
+                    "next_cursor": next_cursor,
+                }
             })
         except:
             return jsonify({
@@ -734,6 +656,54 @@ def init_routes(app):
                 "message": "failed to retrieve responses"
             }), 500
 
+    @app.route('/grades/export', methods=['GET'])
+    @token_required
+    def export_grades():
+        """Stream all grades matching the filters as CSV or NDJSON (admin/faculty only)"""
+        try:
+            if not g.data:
+                return jsonify({"status": "error", "message": "User not authenticated"}), 401
+
+            if g.data.role not in ['admin', 'faculty']:
+                return jsonify({
+                    "status": "error",
+                    "message": "Unauthorized access. Admin or faculty role required."
+                }), 403
+
+            export_format = request.args.get('export_format', 'csv')
+            export_filename = request.args.get('export_filename', 'grades')
+            if export_format not in EXPORT_FORMATS:
+                return jsonify({"status": "error", "message": "Unsupported export format"}), 400
+
+            start_date = request.args.get('start_date')
+            end_date = request.args.get('end_date')
+            case_study_id = request.args.get('case_study_id')
+            student_id = request.args.get('student_id')
+
+            filters = remove_none({
+                'timestamp__gte': datetime.datetime.fromisoformat(start_date) if start_date else None,
+                'timestamp__lte': datetime.datetime.fromisoformat(end_date) if end_date else None,
+                'case_study': ObjectId(case_study_id) if case_study_id else None,
+                'user': ObjectId(student_id) if student_id else None,
+            })
+
+            grades = Grade.objects(**filters).order_by('-timestamp').only(
+                'id', 'user', 'case_study', 'conversation_id', 'timestamp', 'final_score', 'individual_scores'
+            ).as_pymongo().batch_size(EXPORT_BATCH_SIZE)
+
+            return export_response(export_format, export_filename, GRADE_EXPORT_COLUMNS,
+                                   iter_grade_export_rows(grades))
+
+        except ValueError as e:
+            logger.error(f"Invalid parameters in /grades/export: {str(e)}")
+            return jsonify({"status": "error", "message": "Invalid query parameters"}), 400
+        except Exception as e:
+            logger.error(f"Error in /grades/export: {str(e)}")
+            return jsonify({
+                "status": "error",
+                "message": "An error occurred while exporting grades"
+            }), 500
+
     @app.route('/get_conversation_count', methods=['GET'])
     @token_required
     def get_conversation_count():
@@ -744,9 +714,7 @@ def init_routes(app):
                     "message": "User not authenticated"
                 }), 401
 
-            user_email = g.data.email
-
-            user = User.find_by_email(user_email)
+            user = g.data
 
             case_study_id = request.args.get('case_study_id')
 
@@ -777,33 +745,21 @@ def init_routes(app):
                 }), 401
 
             user_email = g.data.email
-            user = User.find_by_email(user_email)
+            user = g.data
             case_study_id = request.args.get('case_study_id')
-            grades = Grade.find_grade_by_user_email(user_email, case_study_id).order_by('-timestamp')
-            reports = []
-            if not grades or len(grades) == 0:
+            grades = [
+                GradeRecord(raw) for raw in
+                GradeRecord.project(Grade.find_grade_by_user_email(user_email, case_study_id).order_by('-timestamp'))
+            ]
+            if not grades:
                 return jsonify({
                     "status": "error",
                     "message": "No grade report found"
                 }), 404
 
-            case_study = {
-                "id": str(grades[0].case_study.id) if grades[0].case_study else None,
-                "title": grades[0].case_study.title if grades[0].case_study else None,
-            }
-
-            for grade in grades:
-                performance_summary = {
-                    key: [{"title": item.title, "description": item.description} for item in items]
-                    for key, items in grade.performance_summary.items()
-                }
-
-                reports.append({
-                    "overall_summary": grade.overall_summary if grade.overall_summary else "Your performance was fair, demonstrating some understanding of the task but lacking in critical thinking and comprehension. Your communication skills were clear, but the response was limited in scope.",
-                    "final_score": grade.final_score,
-                    "individual_scores": grade.individual_scores,
-                    "performance_summary": performance_summary,
-                })
+            case_study = load_case_study_ref(grades[0].case_study_id)
+            reports = [serialize_grade_report(grade) for grade in grades]
+            grade = grades[-1]
 
             return jsonify({
                 "status": "success",
@@ -837,8 +793,7 @@ def init_routes(app):
             case_study_id = request.args.get('case_study_id')
 
             user_email = g.data.email
-            user = User.find_by_email(user_email)
-            grades = Grade.find_grade_by_user_email(user_email, case_study_id)
+            grades = GradeRecord.project(Grade.find_grade_by_user_email(user_email, case_study_id))
 
             if not grades:
                 return jsonify({
@@ -846,26 +801,32 @@ def init_routes(app):
                     "message": "No grades found"
                 }), 404
 
-            formatted_grades = []
-            for grade in grades:
-                performance_summary = {
-                    key: [{"title": item.title, "description": item.description} for item in items]
-                    for key, items in grade.performance_summary.items()
-                }
+            conversation_count = grades.count()
 
-                formatted_grades.append({
-                    "overall_summary": grade.overall_summary if grade.overall_summary else "Your performance was fair, demonstrating some understanding of the task but lacking in critical thinking and comprehension. Your communication skills were clear, but the response was limited in scope.",
-                    "final_score": grade.final_score,
-                    "individual_scores": grade.individual_scores,
-                    "performance_summary": performance_summary
-                })
+            # Only paginate when asked to, so existing clients keep receiving every grade
+            per_page = int(request.args.get('per_page', 0))
+            page = int(request.args.get('page', 1))
+            cursor = request.args.get('cursor')
+            next_cursor = None
+            if per_page > 0:
+                grades, next_cursor = paginate(grades, ['-timestamp', '-id'], per_page, page, cursor)
+
+            formatted_grades = [serialize_grade_report(GradeRecord(raw)) for raw in grades]
 
             return jsonify({
                 "status": "success",
                 "case_study_id": case_study_id,
-                "conversation_count": grades.count(),
-                "grades": formatted_grades
+                "conversation_count": conversation_count,
+                "grades": formatted_grades,
+                "meta": {
+                    "page": page,
+                    "per_page": per_page,
+                    "next_cursor": next_cursor,
+                }
             })
+        except ValueError as e:
+            logger.error(f"Invalid parameters in /view_previous_grades: {str(e)}")
+            return jsonify({"status": "error", "message": "Invalid query parameters"}), 400
         except Exception as e:
             logger.error(f"Error in /view_previous_grades: {str(e)}")
             return jsonify({
@@ -881,25 +842,14 @@ def init_routes(app):
             if not g.data:
                 return jsonify({"status": "error", "message": "User not authenticated"}), 401
 
-            # Get all case studies from the database
-            case_studies = CaseStudy.objects.all()
+            # Get all case studies from the database, with their avatars in one extra query
+            case_studies = [CaseStudyRecord(raw) for raw in CaseStudyRecord.project(CaseStudy.objects.all())]
+            avatars = avatar_records(case.avatar_id for case in case_studies)
 
             # Format the case studies data
-            formatted_case_studies = []
-            for case in case_studies:
-                formatted_case_studies.append({
-                    "id": str(case.id),
-                    "title": case.title,
-                    "description": case.description,
-                    "agentID": case.agent_id,
-                    "avatar": {
-                        "name": case.avatar.name if case.avatar else None,
-                        "image_display": case.avatar.image_display if case.avatar else None,
-                        "image_thumbnail": case.avatar.image_thumbnail if case.avatar else None,
-                        "role": case.avatar.role if case.avatar else None,
-                        "bio": case.avatar.bio if case.avatar else None
-                    },
-                })
+            formatted_case_studies = [
+                serialize_case_study(case, avatars.get(case.avatar_id), include_agent=True) for case in case_studies
+            ]
 
             return jsonify({
                 "status": "success",
@@ -931,18 +881,7 @@ def init_routes(app):
                 }), 404
 
             # Format the case study data
-            formatted_case = {
-                "id": str(case_study.id),
-                "title": case_study.title,
-                "description": case_study.description,
-                "avatar": {
-                    "name": case_study.avatar.name if case_study.avatar else None,
-                    "image_display": case_study.avatar.image_display if case_study.avatar else None,
-                    "image_thumbnail": case_study.avatar.image_thumbnail if case_study.avatar else None,
-                    "role": case_study.avatar.role if case_study.avatar else None,
-                    "bio": case_study.avatar.bio if case_study.avatar else None
-                },
-            }
+            formatted_case = serialize_case_study(case_study, case_study.avatar)
 
             return jsonify({
                 "status": "success",
@@ -968,46 +907,16 @@ def init_routes(app):
             start_date = request.args.get('start_date')
             end_date = request.args.get('end_date')
 
-            case_study = CaseStudy.objects(id=case_study_id).first() if case_study_id else None
-
-            filters = {
-                'timestamp__gte': start_date,
-                'timestamp__lte': end_date,
-                'case_study': case_study
-            }
-
-            filters_sessions = {
-                'case_study_id': case_study_id,
-                'start_time__gte': start_date,
-                'start_time__lte': end_date
-            }
-
-            total_case_studies_completed = Grade.objects(**remove_none(filters)).aggregate(
-                {"$group": {"_id": "$case_study._id", "count": {"$sum": 1}}}
-            )
-
-            average_score = Grade.objects(**remove_none(filters)).average('final_score')
-            total_conversations = ConversationLog.objects(**remove_none(filters)).count()
-            total_sessions = Session.objects(**remove_none(filters_sessions)).count()
-            total_grades = Grade.objects(**remove_none(filters)).count()
-
-            metrics = {
-                "total_students": User.objects(role=UserRole.STUDENT).count(),
-                "total_case_studies": CaseStudy.objects.count(),
-                "total_conversations": total_conversations,
-                "total_sessions": total_sessions,
-                "total_grades": total_grades,
-                "average_score": round(average_score, 2) if average_score else 0,
-                "total_case_studies_completed": sum(
-                    item['count'] for item in total_case_studies_completed
-                ) if total_case_studies_completed else 0,
-            }
+            metrics = aggregate_metrics(case_study_id, start_date, end_date)
 
             return jsonify({
                 "status": "success",
                 "metrics": metrics
             })
 
+        except ValueError as e:
+            logger.error(f"Invalid parameters in /metrics/aggregate: {str(e)}")
+            return jsonify({"status": "error", "message": "Invalid query parameters"}), 400
         except Exception as e:
             logger.error(f"Error in /metrics/aggregate: {str(e)}")
             return jsonify({
@@ -1023,52 +932,23 @@ def init_routes(app):
             if not g.data:
                 return jsonify({"status": "error", "message": "User not authenticated"}), 401
 
-            # Get the start and end dates from the request
+            # Get the start and end dates and bucket size from the request
             start_date = request.args.get('start_date')
             end_date = request.args.get('end_date')
             case_study_id = request.args.get('case_study_id')
+            granularity = request.args.get('granularity', 'day')
 
-            case_study = CaseStudy.objects(id=case_study_id).first() if case_study_id else None
-
-            # Aggregate grades by date
-            grades_metrics = Grade.objects(
-                **remove_none({
-                    'timestamp__gte': start_date,
-                    'timestamp__lte': end_date,
-                    'case_study': case_study
-                })
-            ).aggregate(
-                {
-                    "$group": {
-                        "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp"}},
-                        "communication_score": {"$avg": "$individual_scores.communication"},
-                        "critical_thinking_score": {"$avg": "$individual_scores.critical_thinking"},
-                        "comprehension_score": {"$avg": "$individual_scores.comprehension"},
-                        "average_score": {"$avg": "$final_score"},
-                        "total_grades": {"$sum": 1}
-                    }
-                },
-                {
-                    "$sort": {"_id": 1}
-                }
-            )
-
-            formatted_metrics = []
-            for metric in grades_metrics:
-                formatted_metrics.append({
-                    "date": metric['_id'],
-                    "average_score": metric['average_score'],
-                    "total_grades": metric['total_grades'],
-                    "communication_score": metric['communication_score'],
-                    "critical_thinking_score": metric['critical_thinking_score'],
-                    "comprehension_score": metric['comprehension_score']
-                })
+            # Merged from the pre-aggregated daily rollups rather than grouping raw grades
+            formatted_metrics = grade_timeseries(case_study_id, start_date, end_date, granularity)
 
             return jsonify({
                 "status": "success",
                 "grades_metrics": formatted_metrics
             })
 
+        except ValueError as e:
+            logger.error(f"Invalid parameters in /metrics/grades: {str(e)}")
+            return jsonify({"status": "error", "message": "Invalid query parameters"}), 400
         except Exception as e:
             logger.error(f"Error in /metrics/grades: {str(e)}")
             return jsonify({
@@ -1076,6 +956,35 @@ def init_routes(app):
                 "message": "An error occurred while fetching grades metrics"
             }), 500
 
+    @app.route('/metrics/telemetry', methods=['GET'])
+    @token_required
+    def get_telemetry():
+        """Latency histograms of this process, e.g. model calls and rate limiter queue waits (admin/faculty only)"""
+        try:
+            if not g.data:
+                return jsonify({"status": "error", "message": "User not authenticated"}), 401
+
+            if g.data.role not in ['admin', 'faculty']:
+                return jsonify({
+                    "status": "error",
+                    "message": "Unauthorized access. Admin or faculty role required."
+                }), 403
+
+            name = request.args.get('name')
+            histograms = [h for h in telemetry.snapshot() if not name or h["name"] == name]
+
+            return jsonify({
+                "status": "success",
+                "histograms": histograms
+            })
+
+        except Exception as e:
+            logger.error(f"Error in /metrics/telemetry: {str(e)}")
+            return jsonify({
+                "status": "error",
+                "message": "An error occurred while fetching telemetry"
+            }), 500
+
     @app.route('/students/<student_id>/activity-logs', methods=['GET'])
     @token_required
     def get_students_activity_logs(student_id):
@@ -1101,9 +1010,9 @@ def init_routes(app):
             }
 
             # Get the activity logs for all users
-            activity_logs = Grade.objects(
-                **remove_none(filters)
-            ).order_by('-timestamp').limit(5)
+            activity_logs = prefetch_references(
+                Grade.objects(**remove_none(filters)).order_by('-timestamp').limit(5), 'user', 'case_study'
+            )
 
             formatted_logs = []
             for log in activity_logs:
@@ -1197,8 +1106,7 @@ def init_routes(app):
                 return jsonify({"status": "error", "message": "User not authenticated"}), 401
 
             # Check if user has admin/faculty role
-            user_email = g.data.email
-            user = User.find_by_email(user_email)
+            user = g.data
 
             if not user or user.role not in ['admin', 'faculty']:
                 return jsonify({
@@ -1265,8 +1173,7 @@ def init_routes(app):
             if not g.data:
                 return jsonify({"status": "error", "message": "User not authenticated"}), 401
 
-            user_email = g.data.email
-            user = User.find_by_email(user_email)
+            user = g.data
 
             if not user or user.role not in ['admin', 'faculty']:
                 return jsonify({
@@ -1327,8 +1234,7 @@ def init_routes(app):
                 return jsonify({"status": "error", "message": "User not authenticated"}), 401
 
             # Check if user has admin/faculty role
-            user_email = g.data.email
-            user = User.find_by_email(user_email)
+            user = g.data
 
             if not user or user.role not in ['admin', 'faculty']:
                 return jsonify({
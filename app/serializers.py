@@ -0,0 +1,172 @@
+# serializers.py
+
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional
+
+from .models import CaseStudy, CaseStudyAvatar
+
+DEFAULT_OVERALL_SUMMARY = "Your performance was fair, demonstrating some understanding of the task but lacking in critical thinking and comprehension. Your communication skills were clear, but the response was limited in scope."
+
+
+class GradeRecord:
+    """
+    Lightweight read-only view of a raw grade document, used instead of hydrating a Grade.
+    """
+    __slots__ = ("id", "user_id", "case_study_id", "conversation_id", "overall_summary", "final_score",
+                 "individual_scores", "performance_summary", "timestamp")
+
+    FIELDS = ("id", "user", "case_study", "conversation_id", "overall_summary", "final_score",
+              "individual_scores", "performance_summary", "timestamp")
+
+    @classmethod
+    def project(cls, queryset):
+        """
+        Restrict a queryset to the fields this record reads and return raw documents.
+        """
+        return queryset.only(*cls.FIELDS).as_pymongo()
+
+    def __init__(self, raw: dict):
+        self.id = raw.get("_id")
+        self.user_id = raw.get("user")
+        self.case_study_id = raw.get("case_study")
+        self.conversation_id = raw.get("conversation_id")
+        self.overall_summary = raw.get("overall_summary")
+        self.final_score = raw.get("final_score")
+        self.individual_scores = raw.get("individual_scores") or {}
+        self.performance_summary = raw.get("performance_summary") or {}
+        self.timestamp = raw.get("timestamp")
+
+
+class CaseStudyRecord:
+    """
+    Lightweight read-only view of a raw case study document.
+    """
+    __slots__ = ("id", "title", "description", "agent_id", "avatar_id")
+
+    FIELDS = ("id", "title", "description", "agent_id", "avatar")
+
+    @classmethod
+    def project(cls, queryset):
+        """
+        Restrict a queryset to the fields this record reads and return raw documents.
+        """
+        return queryset.only(*cls.FIELDS).as_pymongo()
+
+    def __init__(self, raw: dict):
+        self.id = raw.get("_id")
+        self.title = raw.get("title")
+        self.description = raw.get("description")
+        self.agent_id = raw.get("agent_id")
+        self.avatar_id = raw.get("avatar")
+
+
+class AvatarRecord:
+    """
+    Lightweight read-only view of a raw case study avatar document.
+    """
+    __slots__ = ("id", "name", "image_display", "image_thumbnail", "role", "bio")
+
+    FIELDS = ("id", "name", "image_display", "image_thumbnail", "role", "bio")
+
+    def __init__(self, raw: dict):
+        self.id = raw.get("_id")
+        self.name = raw.get("name")
+        self.image_display = raw.get("image_display")
+        self.image_thumbnail = raw.get("image_thumbnail")
+        self.role = raw.get("role")
+        self.bio = raw.get("bio")
+
+
+def avatar_records(ids: Iterable) -> Dict[object, AvatarRecord]:
+    """
+    Fetch the avatars with the given ids in one query, keyed by id.
+    """
+    ids = [avatar_id for avatar_id in set(ids) if avatar_id is not None]
+    if not ids:
+        return {}
+    raws = CaseStudyAvatar.objects(id__in=ids).only(*AvatarRecord.FIELDS).as_pymongo()
+    return {raw["_id"]: AvatarRecord(raw) for raw in raws}
+
+
+def serialize_performance_summary(performance_summary: dict) -> dict:
+    """
+    Accepts raw embedded dicts or PerformanceItemDocuments.
+    """
+    return {
+        key: [
+            {"title": item["title"], "description": item["description"]} if isinstance(item, dict)
+            else {"title": item.title, "description": item.description}
+            for item in items
+        ]
+        for key, items in performance_summary.items()
+    }
+
+
+def serialize_grade_report(grade) -> dict:
+    return {
+        "overall_summary": grade.overall_summary if grade.overall_summary else DEFAULT_OVERALL_SUMMARY,
+        "final_score": grade.final_score,
+        "individual_scores": grade.individual_scores,
+        "performance_summary": serialize_performance_summary(grade.performance_summary),
+    }
+
+
+def serialize_grade(grade, user_email: str) -> dict:
+    return {
+        "id": str(grade.id),
+        "user_email": user_email,
+        "timestamp": grade.timestamp.isoformat(),
+        "final_score": grade.final_score,
+        "individual_scores": grade.individual_scores,
+        "performance_summary": serialize_performance_summary(grade.performance_summary),
+        "conversation_id": grade.conversation_id
+    }
+
+
+def serialize_user(user) -> dict:
+    now = datetime.now(timezone.utc).isoformat()
+    return {
+        "id": str(user.id),
+        "email": user.email,
+        "name": user.name,
+        "role": user.role,
+        "title": user.title,
+        "department": user.department,
+        "date_added": user.date_added.isoformat() if user.date_added else now,
+        "date_updated": user.date_updated.isoformat() if user.date_updated else now,
+    }
+
+
+def serialize_avatar(avatar) -> dict:
+    return {
+        "name": avatar.name if avatar else None,
+        "image_display": avatar.image_display if avatar else None,
+        "image_thumbnail": avatar.image_thumbnail if avatar else None,
+        "role": avatar.role if avatar else None,
+        "bio": avatar.bio if avatar else None
+    }
+
+
+def serialize_case_study(case_study, avatar, include_agent: bool = False) -> dict:
+    formatted = {
+        "id": str(case_study.id),
+        "title": case_study.title,
+        "description": case_study.description,
+    }
+    if include_agent:
+        formatted["agentID"] = case_study.agent_id
+    formatted["avatar"] = serialize_avatar(avatar)
+    return formatted
+
+
+def load_case_study_ref(case_study_id: Optional[object]) -> dict:
+    """
+    Fetch just the title of a grade's case study and return the {"id", "title"} pair reports embed.
+    """
+    if case_study_id is None:
+        return {"id": None, "title": None}
+    raw = CaseStudy.objects(id=case_study_id).only('title').as_pymongo().first()
+    return {
+        "id": str(case_study_id) if raw else None,
+        "title": raw.get("title") if raw else None,
+    }
@@ -5,7 +5,7 @@ from datetime import datetime, timezone
 
 from dotenv import load_dotenv
 
-from .models import User
+from .models import User, StudentStats
 from .models import UserRole
 from .utils.auth import hash_password
 from .utils.logger import logger
@@ -23,6 +23,8 @@ def create_user(email, password=None, name=None, role=UserRole.STUDENT, **kwargs
             existing_user.name = name
 
         existing_user.save()
+        User.invalidate_cache(existing_user.email)
+        StudentStats.sync_profile(existing_user)
         return existing_user
 
     hashed_password = hash_password(str(password)) if password else None
@@ -36,6 +38,8 @@ def create_user(email, password=None, name=None, role=UserRole.STUDENT, **kwargs
         **kwargs
     )
     user.save()
+    User.invalidate_cache(user.email)
+    StudentStats.sync_profile(user)
     return user
 
 
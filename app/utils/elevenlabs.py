@@ -1,22 +1,168 @@
+import json
 import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
 
 import requests
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
+from app.models import ConversationPayload
 from app.utils.logger import logger
+from app.utils.telemetry import observe
 
 load_dotenv()
 
 API_KEY = os.getenv('ELEVENLABS_API_KEY')
-headers = {"Xi-Api-Key": API_KEY}
+BASE_URL = os.getenv('ELEVENLABS_BASE_URL', "https://api.elevenlabs.io/v1")
+
+# Conversation statuses after which ElevenLabs no longer changes the payload
+TERMINAL_STATUSES = {"done", "failed"}
+CONVERSATION_CACHE_MAX_ENTRIES = int(os.getenv('CONVERSATION_CACHE_MAX_ENTRIES', 20000))
+CONVERSATION_CACHE_MAX_ENTRY_BYTES = int(os.getenv('CONVERSATION_CACHE_MAX_ENTRY_BYTES', 2 * 1024 * 1024))
+# Hits refresh last_accessed at most this often, so reads rarely turn into writes
+CONVERSATION_CACHE_TOUCH_INTERVAL = timedelta(hours=1)
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised without calling upstream while the circuit breaker is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive upstream failures and fails fast for `reset_timeout`
+    seconds. After that a single trial call is let through: success closes it, failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class ElevenLabsClient:
+    """
+    ElevenLabs API client with a pooled keep-alive session, connect/read timeouts, exponential-backoff
+    retries for idempotent GETs and a circuit breaker. Every call records its latency in the
+    `elevenlabs_request_seconds` histogram.
+    """
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, api_key: str, base_url: str = BASE_URL, connect_timeout: float = 3.05,
+                 read_timeout: float = 20, max_retries: int = 3, backoff_factor: float = 0.5,
+                 pool_size: int = 10, breaker: CircuitBreaker = None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.breaker = breaker or CircuitBreaker()
+
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=self.RETRY_STATUSES,
+            allowed_methods=frozenset(["GET"]),
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.headers.update({"Xi-Api-Key": api_key or ""})
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(self, path: str, endpoint: str, params: dict = None) -> dict:
+        """
+        GET a JSON resource. Raises CircuitOpenError, requests exceptions, or ValueError for bad JSON.
+        """
+        if not self.breaker.allow():
+            observe("elevenlabs_request_seconds", 0, endpoint=endpoint, outcome="circuit_open")
+            raise CircuitOpenError(f"ElevenLabs circuit is open, skipping {endpoint}")
+
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            response = self.session.get(f"{self.base_url}{path}", params=params, timeout=self.timeout)
+            upstream_failure = response.status_code in self.RETRY_STATUSES
+            response.raise_for_status()
+            data = response.json()
+            outcome = "ok"
+            self.breaker.record_success()
+            return data
+        except requests.HTTPError:
+            # Client errors mean upstream is healthy, only overload and server errors trip the breaker
+            if upstream_failure:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+        except requests.RequestException:
+            self.breaker.record_failure()
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            observe("elevenlabs_request_seconds", elapsed, endpoint=endpoint, outcome=outcome)
+            logger.info(f"ElevenLabs {endpoint} {outcome} in {elapsed * 1000:.0f} ms")
+
+    def get_signed_url(self, agent_id: str) -> dict:
+        return self.get("/convai/conversation/get-signed-url", "signed_url", params={"agent_id": agent_id})
+
+    def get_conversation(self, conversation_id: str) -> dict:
+        return self.get(f"/convai/conversations/{conversation_id}", "conversation")
+
+
+client = ElevenLabsClient(
+    API_KEY,
+    connect_timeout=float(os.getenv('ELEVENLABS_CONNECT_TIMEOUT', 3.05)),
+    read_timeout=float(os.getenv('ELEVENLABS_READ_TIMEOUT', 20)),
+    max_retries=int(os.getenv('ELEVENLABS_MAX_RETRIES', 3)),
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.getenv('ELEVENLABS_BREAKER_THRESHOLD', 5)),
+        reset_timeout=float(os.getenv('ELEVENLABS_BREAKER_RESET', 30))
+    )
+)
 
 
 def get_signed_url(agent_id: str) -> str | None:
     try:
-        params = {"agent_id": agent_id}
-        r = requests.get(f"https://api.elevenlabs.io/v1/convai/conversation/get-signed-url", params=params,
-                         headers=headers)
-        data = r.json()
+        data = client.get_signed_url(agent_id)
         signed_url = data.get('signed_url')
         logger.info(f"Signed URL for AgentID: {agent_id}: {signed_url}")
 
@@ -26,11 +172,67 @@ def get_signed_url(agent_id: str) -> str | None:
         return None
 
 
-def get_conversation(conversation_id: str) -> dict | None:
+def load_cached_conversation(conversation_id: str) -> dict | None:
+    cached = ConversationPayload.objects(conversation_id=conversation_id).first()
+    if not cached:
+        return None
+
+    now = datetime.now(timezone.utc)
+    last_accessed = cached.last_accessed.replace(tzinfo=timezone.utc) if cached.last_accessed else None
+    if not last_accessed or now - last_accessed > CONVERSATION_CACHE_TOUCH_INTERVAL:
+        ConversationPayload.objects(id=cached.id).update_one(set__last_accessed=now)
+
+    return json.loads(cached.payload)
+
+
+def store_conversation(conversation_id: str, data: dict):
+    """
+    Write a terminal conversation payload through to the cache, evicting the least recently used
+    entries once the cache holds more than CONVERSATION_CACHE_MAX_ENTRIES.
+    """
+    payload = json.dumps(data)
+    if len(payload) > CONVERSATION_CACHE_MAX_ENTRY_BYTES:
+        return
+
+    now = datetime.now(timezone.utc)
+    ConversationPayload.objects(conversation_id=conversation_id).update_one(
+        upsert=True,
+        set__status=data.get("status"),
+        set__payload=payload,
+        set__size_bytes=len(payload),
+        set__fetched_at=now,
+        set__last_accessed=now
+    )
+
+    excess = ConversationPayload._get_collection().estimated_document_count() - CONVERSATION_CACHE_MAX_ENTRIES
+    if excess > 0:
+        stale_ids = [doc.id for doc in ConversationPayload.objects.order_by('last_accessed').only('id').limit(excess)]
+        ConversationPayload.objects(id__in=stale_ids).delete()
+
+
+def get_conversation(conversation_id: str, refresh: bool = False) -> dict | None:
+    """
+    Get a conversation payload, served from the persistent cache once the conversation has ended.
+    `refresh` bypasses the cache and re-fetches (and re-caches) the payload.
+    """
+    try:
+        if not refresh:
+            cached = load_cached_conversation(conversation_id)
+            if cached is not None:
+                return cached
+    except Exception as e:
+        logger.error(f"Failed to read cached conversation ID: {conversation_id}: {e}")
+
     try:
-        r = requests.get(f"https://api.elevenlabs.io/v1/convai/conversations/{conversation_id}", headers=headers)
-        data = r.json()
-        return data
+        data = client.get_conversation(conversation_id)
     except Exception as e:
         logger.error(f"Failed to get conversation ID: {conversation_id}: {e}")
         return None
+
+    try:
+        if isinstance(data, dict) and data.get("status") in TERMINAL_STATUSES:
+            store_conversation(conversation_id, data)
+    except Exception as e:
+        logger.error(f"Failed to cache conversation ID: {conversation_id}: {e}")
+
+    return data
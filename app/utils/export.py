@@ -0,0 +1,84 @@
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from itertools import islice
+from typing import Iterable, List, Tuple
+
+from bson import ObjectId
+from flask import Response, stream_with_context
+
+from .logger import logger
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 500))
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def batched(rows: Iterable, size: int = EXPORT_BATCH_SIZE):
+    """
+    Yield lists of up to `size` rows from any iterable, e.g. a Mongo cursor.
+    """
+    iterator = iter(rows)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    return str(value)
+
+
+def iter_csv(columns: List[Tuple[str, str]], rows: Iterable[dict]):
+    """
+    Render rows as CSV through the csv module, yielding one chunk per batch of rows.
+    `columns` is a list of (key, header) pairs.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([header for _, header in columns])
+
+    for batch in batched(rows):
+        writer.writerows([row.get(key) for key, _ in columns] for row in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_ndjson(columns: List[Tuple[str, str]], rows: Iterable[dict]):
+    """
+    Render rows as newline-delimited JSON, yielding one chunk per batch of rows.
+    """
+    keys = [key for key, _ in columns]
+    for batch in batched(rows):
+        yield "".join(
+            json.dumps({key: row.get(key) for key in keys}, default=_json_default) + "\n" for row in batch
+        )
+
+
+def export_response(export_format: str, filename: str, columns: List[Tuple[str, str]], rows: Iterable[dict]):
+    """
+    Build a chunked download response that streams `rows` as CSV or NDJSON.
+    """
+    render = iter_csv if export_format == "csv" else iter_ndjson
+
+    def generate():
+        try:
+            yield from render(columns, rows)
+        except Exception as e:
+            logger.error(f"Export of {filename}.{export_format} failed: {str(e)}")
+            raise
+
+    response = Response(stream_with_context(generate()), mimetype=EXPORT_FORMATS[export_format])
+    response.headers["Content-Disposition"] = f"attachment; filename={filename}.{export_format}"
+    return response
@@ -1,13 +1,30 @@
+import hashlib
 import json
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
 
 from dotenv import load_dotenv
 from google import genai
 from google.genai import types
+from mongoengine import NotUniqueError
 
-from app.models import ConversationLog, User, Grade, CaseStudy
-from app.utils.perser import extract_json
+from app.models import ConversationLog, User, Grade, CaseStudy, GradingJob, GradingResult, GradingReport, \
+    CriterionAssessment, FeedbackSummary, SCORE_CRITERIA
+from app.serializers import serialize_grade_report
+from app.utils.perser import parse_json_object
 from .elevenlabs import get_conversation
+from .cache import TTLCache
+from .jobs import JobFailed, WorkerPool, create_job_queue
+from .local_grader import LocalGrader
+from .hedging import DeadlineExceeded, HedgeLimiter, run_hedged
+from .ratelimit import AdaptiveConcurrency, RateLimiter, RateLimitTimeout, create_token_bucket
+from .telemetry import histogram, observe
+from .transcript import compact_transcript, count_tokens
 from ..utils.logger import logger
 
 load_dotenv()
@@ -15,24 +32,67 @@ load_dotenv()
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
 
+GRADING_QUEUE_BACKEND = os.getenv("GRADING_QUEUE_BACKEND", "mongo")
+GRADING_WORKER_CONCURRENCY = int(os.getenv("GRADING_WORKER_CONCURRENCY", 4))
+# Grading runs in `flask grading worker` processes; set to start a pool inside each web process instead.
+# The Docker image sets it, so a web-only deployment still grades; turn it off once workers run separately.
+GRADING_EMBEDDED_WORKERS = os.getenv("GRADING_EMBEDDED_WORKERS", "false").lower() == "true"
+GRADING_JOB_MAX_ATTEMPTS = int(os.getenv("GRADING_JOB_MAX_ATTEMPTS", 3))
+GRADING_JOB_VISIBILITY_TIMEOUT = float(os.getenv("GRADING_JOB_VISIBILITY_TIMEOUT", 120))
+# Fetch the ElevenLabs transcript even when the client supplied one, and prefer it if they differ
+GRADING_VERIFY_TRANSCRIPT = os.getenv("GRADING_VERIFY_TRANSCRIPT", "false").lower() == "true"
+GRADING_MODEL = os.getenv("GRADING_MODEL", "gemini-2.0-flash")
+# "gemini", or "local" for the offline stub used in load tests
+GRADING_BACKEND = os.getenv("GRADING_BACKEND", "gemini")
+# Reuse the stored result when the same transcript is graded again against the same case and prompt
+GRADING_RESULT_CACHE = os.getenv("GRADING_RESULT_CACHE", "true").lower() == "true"
+# Upload the static rubric plus each case description once as Gemini cached content and reference it by name
+GRADING_CONTEXT_CACHE = os.getenv("GRADING_CONTEXT_CACHE", "false").lower() == "true"
+GRADING_CONTEXT_CACHE_TTL = int(os.getenv("GRADING_CONTEXT_CACHE_TTL", 3600))
+# "single": one call grades everything; "per_criterion": one call per criterion plus a summary call, concurrently
+GRADING_MODE = os.getenv("GRADING_MODE", "single")
+GRADING_CALL_CONCURRENCY = int(os.getenv("GRADING_CALL_CONCURRENCY", 16))
+# Seconds a grade may spend in model calls. Workers heartbeat while grading, so it may exceed the visibility timeout
+GRADING_DEADLINE = float(os.getenv("GRADING_DEADLINE", 90))
+# A call still unanswered at this latency quantile of its recent calls is duplicated and the first answer wins
+GRADING_HEDGE_QUANTILE = float(os.getenv("GRADING_HEDGE_QUANTILE", 0.95))
+GRADING_HEDGE_MIN_SAMPLES = int(os.getenv("GRADING_HEDGE_MIN_SAMPLES", 20))
+# Hedge delay until enough calls have been observed; 0 disables hedging
+GRADING_HEDGE_DELAY = float(os.getenv("GRADING_HEDGE_DELAY", 30))
+GRADING_HEDGE_MAX_IN_FLIGHT = int(os.getenv("GRADING_HEDGE_MAX_IN_FLIGHT", 4))
+GRADING_HEDGE_RATIO = float(os.getenv("GRADING_HEDGE_RATIO", 0.1))
 
-def infer(formatted_transcript, case_study_summary):
-    """
-    Grade the conversation transcript using the Gemini API.
-    """
+# Shared across processes with the mongo backend; "local" limits this process only
+GRADING_RATE_LIMIT_BACKEND = os.getenv("GRADING_RATE_LIMIT_BACKEND", "mongo")
+GRADING_RPM = float(os.getenv("GRADING_RPM", 2000))
+GRADING_TPM = float(os.getenv("GRADING_TPM", 4000000))
+# Output tokens reserved per call on top of the prompt, since the response size isn't known up front
+GRADING_EXPECTED_OUTPUT_TOKENS = int(os.getenv("GRADING_EXPECTED_OUTPUT_TOKENS", 1500))
+GRADING_MAX_CONCURRENCY = int(os.getenv("GRADING_MAX_CONCURRENCY", GRADING_CALL_CONCURRENCY))
 
-    weights = {
-        "critical_thinking": 0.40,
-        "comprehension": 0.30,
-        "communication": 0.30
-    }
+
+def normalise_weights(weights: Dict[str, float]) -> Dict[str, float]:
     total_weight = sum(weights.values())
     if abs(total_weight - 1.0) > 1e-9:
-        print(f"Warning: Weights do not sum to 1.0 (sum is {total_weight}). Adjusting prompt.")
-        adjusted_weights = {k: v / total_weight for k, v in weights.items()}
-        weights = adjusted_weights
+        logger.warning(f"Weights do not sum to 1.0 (sum is {total_weight}). Adjusting prompt.")
+        return {k: v / total_weight for k, v in weights.items()}
+    return weights
 
-    grading_prompt = f"""
+
+GRADING_WEIGHTS = normalise_weights({
+    "critical_thinking": 0.40,
+    "comprehension": 0.30,
+    "communication": 0.30
+})
+
+SCORING_ANCHORS = """\
+        "0-10": Minimal or vague response with little relevance to the case. Concepts may be mentioned but not clearly explained or applied (like a 0-1 on a 5-point scale).
+        "11-20": Partial or underdeveloped response that identifies a few relevant concepts but lacks clarity, depth, or proper contextual application (like a 2 on a 5-point scale).
+        "21-40": Basic understanding demonstrated with some relevant points covered. Response shows limited depth or analysis, and application to the case may be somewhat surface-level or generic (like a 3 on a 5-point scale).
+        "41-70": Good understanding of the subject matter with clear identification of key elements. Demonstrates logical analysis and applies concepts well, though may lack some depth or precision in certain areas (like a 4 on a 5-point scale).
+        "71-100": Comprehensive and insightful analysis of the subject matter, clearly identifying relevant components, stakeholders, or frameworks. Demonstrates deep understanding through well-structured arguments, critical thinking, and detailed application to the case study context (like a 5 on a 5-point scale)."""
+
+GRADING_PROMPT_TEMPLATE = """
       You are an advanced senior grading lecturer for Miva Open University. Your role is to conduct a rigorous academic assessment of the following conversation transcript submitted by a user. You are to evaluate the response of the "user" to the agent's questions. Your evaluation must be aligned with the analytical and conceptual standards expected at the Masters level.
 
       **Context:**
@@ -46,11 +106,7 @@ def infer(formatted_transcript, case_study_summary):
 
       **Scoring Guidance (Qualitative Anchors for 0-100 Scale):**
       Use these descriptions as qualitative anchors when assigning a score on the 0-100 scale for each criterion:
-        "0-10": Minimal or vague response with little relevance to the case. Concepts may be mentioned but not clearly explained or applied (like a 0-1 on a 5-point scale).
-        "11-20": Partial or underdeveloped response that identifies a few relevant concepts but lacks clarity, depth, or proper contextual application (like a 2 on a 5-point scale).
-        "21-40": Basic understanding demonstrated with some relevant points covered. Response shows limited depth or analysis, and application to the case may be somewhat surface-level or generic (like a 3 on a 5-point scale).
-        "41-70": Good understanding of the subject matter with clear identification of key elements. Demonstrates logical analysis and applies concepts well, though may lack some depth or precision in certain areas (like a 4 on a 5-point scale).
-        "71-100": Comprehensive and insightful analysis of the subject matter, clearly identifying relevant components, stakeholders, or frameworks. Demonstrates deep understanding through well-structured arguments, critical thinking, and detailed application to the case study context (like a 5 on a 5-point scale).
+{scoring_anchors}
 
       **Internal Reasoning Process (Chain of Thought - Do NOT include this in the final output):**
       1.  Carefully read and understand the provided case study summary and the conversation transcript.
@@ -59,14 +115,11 @@ def infer(formatted_transcript, case_study_summary):
       4.  For each user response (or lack thereof), analyze its quality against each of the three criteria: Critical Thinking, Comprehension, and Communication.
       5.  Based on the analysis and the scoring guidance, assign a preliminary qualitative level (like 0-5) for each criterion.
       6.  Convert this qualitative assessment into a precise 0-100 integer score for each criterion, ensuring it aligns with the qualitative anchors (e.g., if it feels like a strong '4', assign a score in the 70s). Justify each score by referencing specific parts of the transcript and the scoring guidance.
-      7.  Calculate the final overall score as a weighted average of the three 0-100 individual scores using the specified weights: Critical Thinking ({weights['critical_thinking']:.0%}), Comprehension ({weights['comprehension']:.0%}), Communication ({weights['communication']:.0%}). Round the final score to the nearest integer.
+      7.  Calculate the final overall score as a weighted average of the three 0-100 individual scores using the specified weights: Critical Thinking ({weights[critical_thinking]:.0%}), Comprehension ({weights[comprehension]:.0%}), Communication ({weights[communication]:.0%}). Round the final score to the nearest integer.
       8.  Synthesize the individual scores, justifications, and the weighted final score into a concise overall summary of the user's performance.
       9.  Identify the top 3 strengths and top 3 weaknesses based on the detailed analysis for each criterion. Ensure each has a clear title and description.
       10. Format the final output *strictly* as the requested JSON object. Double-check that *only* the JSON is present in the final output.
 
-      **Transcript:**
-      {formatted_transcript}
-
       **Output Format:**
       Return the response strictly in JSON string format with the following structure. Do NOT include any text before or after the JSON string (no ```json or ```).
 
@@ -105,72 +158,679 @@ def infer(formatted_transcript, case_study_summary):
       - Return *only* the JSON object. No additional text.
       - Ensure the `final_score` is calculated precisely using the specified weighted average formula and rounded to the nearest integer.
       - Follow the "Internal Reasoning Process" steps *before* generating the final JSON.
+
+      **Transcript:**
+      {formatted_transcript}
       """
 
-    client = genai.Client(api_key=GOOGLE_API_KEY)
+CRITERIA = {
+    "critical_thinking": ("Critical Thinking", "How well did the user analyze the problem, draw logical conclusions, "
+                                               "and demonstrate strategic insight?"),
+    "comprehension": ("Comprehension", "How well did the user understand the context and intent of the "
+                                       "professional's questions?"),
+    "communication": ("Communication", "How clearly and persuasively did the user communicate their ideas?"),
+}
 
-    response = client.models.generate_content(
-        model="gemini-2.0-flash",
-        contents=grading_prompt,
-        config=types.GenerateContentConfig(
-            response_mime_type="application/json",
-            temperature=0.5
-        )
-    )
+CRITERION_PROMPT_TEMPLATE = """
+      You are an advanced senior grading lecturer for Miva Open University. Assess a single criterion of the following conversation transcript submitted by a user, evaluating the responses of the "user" to the agent's questions against the analytical and conceptual standards expected at the Masters level.
 
-    return response.text
+      **Context:**
+      {case_study_summary}
 
+      **Criterion: {criterion_title}**
+      {criterion_question}
 
-def grade_conversation(conversation_id: str, user_email: str, case_study: CaseStudy,
-                       transcript_from_user: list = None):
+      **Scoring Guidance (Qualitative Anchors for 0-100 Scale):**
+{scoring_anchors}
+
+      **Output Format:**
+      Return only this JSON object, with no text or ``` around it:
+      {{"score": int, "justification": "Justification for the 0-100 {criterion_title} score, referencing the transcript and the qualitative anchors."}}
+
+      **CRITICAL INSTRUCTIONS:**
+      - Apply a strict and rigorous grading approach that reflects Masters-level expectations. Don't be generous.
+      - Focus *only* on the user's responses to the professional's questions, and only on {criterion_title}.
+      - If there is no relevant user response to a question, take that into account and score it as 0.
+
+      **Transcript:**
+      {formatted_transcript}
+      """
+
+SUMMARY_PROMPT_TEMPLATE = """
+      You are an advanced senior grading lecturer for Miva Open University. Write the feedback for the following conversation transcript submitted by a user, evaluating the responses of the "user" to the agent's questions at Masters level. Scores are assigned separately; do not score.
+
+      **Context:**
+      {case_study_summary}
+
+      **Grading Criteria (Masters Level):**
+      - "Critical Thinking": {critical_thinking}
+      - "Comprehension": {comprehension}
+      - "Communication": {communication}
+
+      **Output Format:**
+      Return only this JSON object, with no text or ``` around it:
+      {{
+          "overall_summary": analytical feedback as a lecturer would give after scrutinizing the conversation against the grading criteria and context,
+          "performance_summary": {{
+              "strengths": [{{"title": "Clear communication", "description": analytical feedback}}],
+              "weaknesses": [{{"title": "Lack of critical thinking", "description": analytical feedback}}]
+          }}
+      }}
+
+      **CRITICAL INSTRUCTIONS:**
+      - Give the top 3 strengths and top 3 weaknesses, each with a clear title and description.
+      - Don't give generic feedback but focus on how the conversation stands against the grading criteria and the context.
+      - Report feedback directly to the user using "you" & "your".
+      - Do not refer to the professional as "agent"; use their title from the transcript if available, or a neutral term like "the professional".
+
+      **Transcript:**
+      {formatted_transcript}
+      """
+
+
+def _compile_prompt(template: str, **static) -> Tuple[str, str, str]:
     """
-    Fetch the conversation transcript, grade it, and return the structured JSON response.
+    Render everything static in the template once, returning the text around the two per-call slots:
+    (head, rubric, tail) so that prompt = head + case description + rubric + transcript + tail.
     """
-    conversation = get_conversation(conversation_id)
-    transcript = transcript_from_user or conversation.get("transcript")
+    case_slot, transcript_slot = "\x00case\x00", "\x00transcript\x00"
+    rendered = template.format(case_study_summary=case_slot, formatted_transcript=transcript_slot, **static)
+    head, rest = rendered.split(case_slot)
+    rubric, tail = rest.split(transcript_slot)
+    return head, rubric, tail
 
-    if not transcript:
-        logger.error("Transcript is empty or missing")
+
+PROMPT_HEAD, PROMPT_RUBRIC, PROMPT_TAIL = _compile_prompt(GRADING_PROMPT_TEMPLATE, weights=GRADING_WEIGHTS,
+                                                          scoring_anchors=SCORING_ANCHORS)
+CRITERION_PROMPTS = {
+    criterion: _compile_prompt(CRITERION_PROMPT_TEMPLATE, criterion_title=title, criterion_question=question,
+                               scoring_anchors=SCORING_ANCHORS)
+    for criterion, (title, question) in CRITERIA.items()
+}
+SUMMARY_PROMPT = _compile_prompt(SUMMARY_PROMPT_TEMPLATE, **{key: question for key, (_, question) in CRITERIA.items()})
+
+
+def _prompt_text(*prompts: Tuple[str, str, str]) -> str:
+    return "".join("".join(parts) for parts in prompts)
+
+
+# Changes whenever a prompt or the weights do, so results cached under an older rubric are never reused
+GRADING_PROMPT_VERSION = hashlib.sha256(
+    _prompt_text((PROMPT_HEAD, PROMPT_RUBRIC, PROMPT_TAIL), *CRITERION_PROMPTS.values(), SUMMARY_PROMPT).encode()
+).hexdigest()[:16]
+
+GENERATION_CONFIG = {"response_mime_type": "application/json", "temperature": 0.5}
+
+
+def build_prompt(transcript_text: str, case_study_summary: str, prompt: Tuple[str, str, str] = None) -> str:
+    head, rubric, tail = prompt or (PROMPT_HEAD, PROMPT_RUBRIC, PROMPT_TAIL)
+    return head + case_study_summary + rubric + transcript_text + tail
+
+
+def weighted_score(individual_scores: Dict[str, int]) -> int:
+    """
+    Final score as the GRADING_WEIGHTS weighted average of the criterion scores, rounded half up.
+    """
+    return int(sum(GRADING_WEIGHTS[criterion] * individual_scores.get(criterion, 0)
+                   for criterion in GRADING_WEIGHTS) + 0.5)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> genai.Client:
+    """
+    Process-wide Gemini client, so connections are pooled and reused across grades.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            # Calls abandoned at the grade deadline still end at the HTTP timeout instead of running on
+            _client = genai.Client(api_key=GOOGLE_API_KEY,
+                                   http_options=types.HttpOptions(timeout=int(GRADING_DEADLINE * 1000)))
+        return _client
+
+
+# Cached content handles by case; kept a little shorter than the server-side TTL so expired handles aren't used
+context_caches = TTLCache(maxsize=256, ttl=GRADING_CONTEXT_CACHE_TTL * 0.9)
+_context_cache_lock = threading.Lock()
+
+
+def context_cache_key(case_study_summary: str) -> str:
+    return hashlib.sha256(f"{GRADING_MODEL}:{GRADING_PROMPT_VERSION}:{case_study_summary}".encode()).hexdigest()
+
+
+def get_context_cache(case_study_summary: str) -> Optional[str]:
+    """
+    Name of the cached content holding the prompt prefix for this case, created on first use.
+    Returns None when it cannot be created, e.g. when the prefix is below the model's caching minimum;
+    that failure is remembered for the cache TTL so it isn't retried on every grade.
+    """
+    key = context_cache_key(case_study_summary)
+    name = context_caches.get(key)
+    if name is not None:
+        return name or None
+
+    with _context_cache_lock:
+        name = context_caches.get(key)
+        if name is None:
+            try:
+                prefix = PROMPT_HEAD + case_study_summary + PROMPT_RUBRIC
+                with model_limiter.limit(tokens=count_tokens(prefix), timeout=GRADING_DEADLINE):
+                    cached_content = get_client().caches.create(
+                        model=GRADING_MODEL,
+                        config=types.CreateCachedContentConfig(
+                            display_name=f"grading-{key[:16]}",
+                            contents=[prefix],
+                            ttl=f"{GRADING_CONTEXT_CACHE_TTL}s"
+                        )
+                    )
+                name = cached_content.name
+                logger.info(f"Created grading context cache {name}")
+            except Exception as e:
+                logger.warning(f"Unable to create grading context cache: {str(e)}")
+                name = ""
+            context_caches.set(key, name)
+    return name or None
+
+
+model_limiter = RateLimiter(
+    "gemini",
+    create_token_bucket(GRADING_RATE_LIMIT_BACKEND, f"gemini:{GRADING_MODEL}", GRADING_RPM, GRADING_TPM),
+    AdaptiveConcurrency(initial=max(GRADING_MAX_CONCURRENCY // 2, 1), maximum=GRADING_MAX_CONCURRENCY)
+)
+
+
+def generate(contents: str, call: str, timings: List[dict], hedge: bool = False, deadline: float = None,
+             **config) -> Tuple[str, dict]:
+    """
+    One Gemini call through the rate limiter, timed into `timings` and the `grading_call_seconds` histogram.
+    Returns the response text and the call's timing entry.
+    Time queued in the limiter is recorded separately as `wait`, so it doesn't skew hedge delays.
+    The timing entry also carries the token counts reported by the API.
+    Raises DeadlineExceeded instead of starting the call once `deadline` has passed, e.g. for an attempt
+    that was queued behind the limiter while the grade failed.
+    """
+    if deadline and time.monotonic() >= deadline:
+        raise DeadlineExceeded(f"Grading call {call} not started: the deadline has passed")
+    queued = time.perf_counter()
+    start = None
+    outcome = "error"
+    entry = {"call": call, "hedge": hedge}
+    try:
+        timeout = max(deadline - time.monotonic(), 0) if deadline else None
+        with model_limiter.limit(tokens=count_tokens(contents) + GRADING_EXPECTED_OUTPUT_TOKENS, timeout=timeout):
+            if deadline and time.monotonic() >= deadline:
+                raise DeadlineExceeded(f"Grading call {call} not started: the deadline passed while queued")
+            start = time.perf_counter()
+            response = get_client().models.generate_content(
+                model=GRADING_MODEL,
+                contents=contents,
+                config=types.GenerateContentConfig(**GENERATION_CONFIG, **config)
+            )
+        outcome = "ok"
+        if response.usage_metadata:
+            entry["input_tokens"] = response.usage_metadata.prompt_token_count
+            entry["output_tokens"] = response.usage_metadata.candidates_token_count
+        return response.text, entry
+    except RateLimitTimeout:
+        outcome = "rate_limited"
+        raise
+    except DeadlineExceeded:
+        outcome = "expired"
+        raise
+    finally:
+        end = time.perf_counter()
+        if start is None:
+            start = end
+        else:
+            observe("grading_call_seconds", end - start, call=call, outcome=outcome)
+        entry.update(seconds=round(end - start, 3), wait=round(start - queued, 3), outcome=outcome)
+        timings.append(entry)
+
+
+hedge_limiter = HedgeLimiter(max_in_flight=GRADING_HEDGE_MAX_IN_FLIGHT, ratio=GRADING_HEDGE_RATIO)
+
+
+def hedge_delay(call: str) -> float:
+    """
+    Seconds before a call is hedged: the GRADING_HEDGE_QUANTILE latency of its successful calls so far,
+    or GRADING_HEDGE_DELAY until GRADING_HEDGE_MIN_SAMPLES have been seen. Never hedges when the delay is 0.
+    """
+    if not GRADING_HEDGE_DELAY:
+        return float("inf")
+    latencies = histogram("grading_call_seconds", call=call, outcome="ok")
+    if latencies.count < GRADING_HEDGE_MIN_SAMPLES:
+        return GRADING_HEDGE_DELAY
+    return latencies.quantile(GRADING_HEDGE_QUANTILE)
+
+
+def run_calls(requests: Dict[str, Tuple[str, dict]], timings: List[dict], deadline: float) -> Dict[str, str]:
+    """
+    Make the model calls in `requests` (name -> (contents, config)) concurrently with hedging and
+    return their texts by name. Raises DeadlineExceeded when they don't all answer by `deadline`.
+    The timing entry of the attempt that answered each call is marked `won`; only those count towards usage.
+    """
+    tasks = {
+        name: (lambda hedge, name=name, contents=contents, config=config:
+               generate(contents, name, timings, hedge=hedge, deadline=deadline, **config))
+        for name, (contents, config) in requests.items()
+    }
+    results = run_hedged(tasks, call_executor, deadline, hedge_delay, hedge_limiter)
+    for _, entry in results.values():
+        entry["won"] = True
+    return {name: text for name, (text, _) in results.items()}
+
+
+def infer(transcript_text: str, case_study_summary: str, timings: List[dict] = None, deadline: float = None) -> str:
+    """
+    Grade the conversation transcript using the Gemini API, within `deadline` (a time.monotonic() value,
+    default GRADING_DEADLINE from now).
+    With GRADING_CONTEXT_CACHE, only the transcript is sent and the prefix is referenced from the context cache.
+    """
+    timings = [] if timings is None else timings
+    deadline = deadline or time.monotonic() + GRADING_DEADLINE
+    case_study_summary = case_study_summary or ""
+
+    cache_name = get_context_cache(case_study_summary) if GRADING_CONTEXT_CACHE else None
+    if cache_name:
+        try:
+            request = (transcript_text + PROMPT_TAIL, {"cached_content": cache_name})
+            return run_calls({"grade": request}, timings, deadline)["grade"]
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            logger.warning(f"Grading with context cache {cache_name} failed, sending the full prompt: {str(e)}")
+            context_caches.invalidate(context_cache_key(case_study_summary))
+
+    return run_calls({"grade": (build_prompt(transcript_text, case_study_summary), {})}, timings, deadline)["grade"]
+
+
+# Runs individual model calls only, never tasks that wait on other calls, so it cannot deadlock
+call_executor = ThreadPoolExecutor(max_workers=GRADING_CALL_CONCURRENCY, thread_name_prefix="grading-call")
+
+
+def infer_per_criterion(transcript_text: str, case_study_summary: str, timings: List[dict] = None,
+                        deadline: float = None) -> dict:
+    """
+    Grade with one focused call per criterion and a feedback summary call, all running concurrently,
+    so latency is bound by the slowest short generation rather than one long one.
+    Returns the combined result in the GradingReport shape.
+    """
+    timings = [] if timings is None else timings
+    deadline = deadline or time.monotonic() + GRADING_DEADLINE
+    case_study_summary = case_study_summary or ""
+
+    requests = {
+        criterion: (build_prompt(transcript_text, case_study_summary, prompt), {})
+        for criterion, prompt in CRITERION_PROMPTS.items()
+    }
+    requests["summary"] = (build_prompt(transcript_text, case_study_summary, SUMMARY_PROMPT), {})
+    responses = run_calls(requests, timings, deadline)
+
+    individual_scores, justifications = {}, {}
+    for criterion in SCORE_CRITERIA:
+        assessment = parse_json_object(responses[criterion], CriterionAssessment)
+        individual_scores[criterion] = assessment.score
+        justifications[criterion] = assessment.justification
+    summary = parse_json_object(responses["summary"], FeedbackSummary)
+
+    return GradingReport(
+        overall_summary=summary.overall_summary,
+        final_score=weighted_score(individual_scores),
+        individual_scores=individual_scores,
+        individual_score_justifications=justifications,
+        performance_summary=summary.performance_summary
+    ).model_dump()
+
+
+class GeminiGrader:
+    """
+    Grades with the Gemini API: one call in "single" mode, or one per criterion plus a summary call.
+    """
+    model = GRADING_MODEL
+
+    def grade(self, transcript_text: str, case_study_summary: str, mode: str, timings: List[dict],
+              deadline: float) -> str:
+        """
+        Return the grading response text (a GradingReport as JSON) for the compacted transcript.
+        """
+        if mode == "per_criterion":
+            return json.dumps(infer_per_criterion(transcript_text, case_study_summary, timings, deadline))
+        return infer(transcript_text, case_study_summary, timings, deadline)
+
+
+def create_grader(backend: str):
+    """
+    Build the grader for the configured backend ("gemini" or "local").
+    """
+    if backend == "local":
+        return LocalGrader()
+    if backend == "gemini":
+        return GeminiGrader()
+    raise ValueError(f"Unknown grader backend: {backend}")
+
+
+grader = create_grader(GRADING_BACKEND)
+
+
+def parse_grading_response(grading_response: str) -> dict:
+    """
+    Validate the model's response as a GradingReport and return it as a plain dict.
+    Raises ValueError when the response holds no valid report.
+    """
+    try:
+        return parse_json_object(grading_response, GradingReport).model_dump()
+    except ValueError as e:
+        logger.error(f"Unusable grading response ({str(e)}): {(grading_response or '')[:500]}")
+        raise
+
+
+def grading_cache_key(transcript_text: str, case_study_summary: str, model: str = None, mode: str = None) -> str:
+    """
+    Content address of a grading request: the compacted transcript, case description, model (default the
+    configured grader's), grading mode and prompt version. Compaction already drops whitespace differences
+    and filler turns, so they do not change the key.
+    """
+    material = json.dumps({
+        "transcript": transcript_text,
+        "context": " ".join((case_study_summary or "").split()),
+        "model": model or grader.model,
+        "mode": mode or GRADING_MODE,
+        "prompt_version": GRADING_PROMPT_VERSION,
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+_template_tokens = {}
+
+
+def prompt_tokens(transcript_tokens: int, case_study_summary: str, mode: str = None) -> int:
+    """
+    Input token count of the grading prompts of a mode, from the templates, the case description and
+    the transcript, which every call of the mode repeats.
+    """
+    mode = mode or GRADING_MODE
+    prompts = ([(PROMPT_HEAD, PROMPT_RUBRIC, PROMPT_TAIL)] if mode == "single"
+               else [*CRITERION_PROMPTS.values(), SUMMARY_PROMPT])
+    if mode not in _template_tokens:
+        _template_tokens[mode] = count_tokens(_prompt_text(*prompts))
+    return _template_tokens[mode] + len(prompts) * (count_tokens(case_study_summary or "") + transcript_tokens)
+
+
+@contextmanager
+def timed_stage(stages: Dict[str, float], stage: str):
+    """
+    Time the block into stages[stage] (seconds) and the `grading_stage_seconds` histogram.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stages[stage] = round(stages.get(stage, 0) + elapsed, 3)
+        observe("grading_stage_seconds", elapsed, stage=stage)
+
+
+def grade_transcript(formatted_transcript: list, case_study_summary: str, use_cache: bool = None,
+                     mode: str = None, before_model_call: Callable[[], None] = None) -> Tuple[str, dict, dict]:
+    """
+    Run the configured grader (GRADING_BACKEND) on a transcript and return (raw response, parsed result,
+    usage). The transcript is compacted to the token budget first.
+    `mode` (default GRADING_MODE) is "single" or "per_criterion"; usage["calls"] holds the timing of each
+    model call and usage["stages"] the seconds spent compacting, grading and parsing. usage["input_tokens"]
+    and usage["output_tokens"] count the attempt that answered each call, as reported by the API, else
+    estimated from the prompts and the response; a cache hit sets usage["cached"] and counts no tokens.
+    Either way the final score is the locally computed weighted average of the criterion scores.
+    Model calls are hedged and must all answer within GRADING_DEADLINE seconds, or DeadlineExceeded is raised.
+    With the result cache enabled (default GRADING_RESULT_CACHE), an identical earlier request is
+    answered from the cache. `before_model_call()` runs only when the model is actually called, e.g. to
+    charge a caller's own rate budget.
+    """
+    mode = mode or GRADING_MODE
+    if mode not in ("single", "per_criterion"):
+        raise ValueError(f"Unknown grading mode: {mode}")
+
+    stages = {}
+    with timed_stage(stages, "compact"):
+        transcript_text, transcript_tokens = compact_transcript(formatted_transcript)
+    usage = {"input_tokens": 0, "output_tokens": 0, "model": grader.model, "mode": mode, "cached": False,
+             "calls": [], "stages": stages}
+
+    use_cache = GRADING_RESULT_CACHE if use_cache is None else use_cache
+    key = grading_cache_key(transcript_text, case_study_summary, mode=mode) if use_cache else None
+
+    if key:
+        with timed_stage(stages, "cache_lookup"):
+            cached = GradingResult.objects(key=key).modify(new=True, inc__hits=1,
+                                                           set__last_hit_at=datetime.now(timezone.utc))
+        if cached:
+            try:
+                with timed_stage(stages, "parse"):
+                    grading_result = parse_grading_response(cached.result)
+            except ValueError:
+                # Stored before validation was strict enough; drop it and ask the model again
+                logger.warning(f"Evicting invalid cached grading result {key[:12]}")
+                evict_grading_result(key)
+            else:
+                logger.info(f"Grading result cache hit {key[:12]}")
+                # No model call was made, so no tokens were spent
+                usage.update(model=cached.model, cached=True)
+                return cached.result, grading_result, usage
+
+    if before_model_call:
+        before_model_call()
+    # Snapshot of the calls that answered: abandoned attempts may still append to the shared list afterwards
+    timings = []
+    deadline = time.monotonic() + GRADING_DEADLINE
+    with timed_stage(stages, "infer"):
+        grading_response = grader.grade(transcript_text, case_study_summary, mode, timings, deadline)
+    with timed_stage(stages, "parse"):
+        grading_result = parse_grading_response(grading_response)
+
+    usage["calls"] = list(timings)
+    # Only the attempt that answered each call counts: a hedge that also finished didn't add to the result
+    answered = [t for t in usage["calls"] if t.get("won") and t.get("output_tokens") is not None]
+    if answered:
+        usage["input_tokens"] = sum(t["input_tokens"] or 0 for t in answered)
+        usage["output_tokens"] = sum(t["output_tokens"] for t in answered)
+    else:
+        usage["input_tokens"] = prompt_tokens(transcript_tokens, case_study_summary, mode)
+        usage["output_tokens"] = count_tokens(grading_response)
+
+    model_score = grading_result["final_score"]
+    grading_result["final_score"] = weighted_score(grading_result["individual_scores"])
+    if mode == "single" and model_score != grading_result["final_score"]:
+        logger.info(f"Model final score {model_score} replaced by weighted score {grading_result['final_score']}")
+    logger.info(f"Graded in {mode} mode: " + ", ".join(f"{t['call']} {t['seconds']}s" for t in usage["calls"]))
+
+    if key:
+        # Only a result that still validates after the weighted final score is applied is reused
+        GradingReport.model_validate(grading_result)
+        GradingResult.objects(key=key).update_one(
+            upsert=True,
+            set__model=grader.model,
+            set__prompt_version=GRADING_PROMPT_VERSION,
+            set__result=json.dumps(grading_result),
+            set_on_insert__created_at=datetime.now(timezone.utc)
+        )
+    return grading_response, grading_result, usage
+
+
+def evict_grading_result(key: str) -> bool:
+    """
+    Remove one cached grading result, so the next identical request goes to the model. Returns whether it existed.
+    """
+    return GradingResult.objects(key=key).delete() > 0
+
+
+def conversation_cache_key(conversation_id: str, mode: str = None) -> Optional[str]:
+    """
+    Result cache key that grading the logged transcript of a conversation would use now, or None without a log.
+    """
+    log = ConversationLog.find_by_conversation_id(conversation_id)
+    if not log:
         return None
+    transcript_text, _ = compact_transcript(format_transcript(log.transcript))
+    case_study_summary = log.case_study.description if log.case_study else ""
+    return grading_cache_key(transcript_text, case_study_summary, mode=mode)
+
 
+def format_transcript(transcript: list) -> list:
+    """
+    Normalise transcript messages (dicts or objects) to {"role", "message"} dicts.
+    """
     formatted_transcript = []
-    for message in transcript:
-        role = message["role"] if isinstance(message, dict) else getattr(message, "role", None)
-        msg = message["message"] if isinstance(message, dict) else getattr(message, "message", None)
+    for message in transcript or []:
+        role = message.get("role") if isinstance(message, dict) else getattr(message, "role", None)
+        msg = message.get("message") if isinstance(message, dict) else getattr(message, "message", None)
         formatted_transcript.append({
             "role": role,
             "message": msg
         })
+    return formatted_transcript
+
+
+def fetch_remote_transcript(conversation_id: str) -> list:
+    conversation = get_conversation(conversation_id)
+    return format_transcript(conversation.get("transcript") if conversation else None)
+
+
+def grade_conversation(conversation_id: str, user_email: str, case_study: CaseStudy,
+                       transcript_from_user: list = None, on_progress=None, verify_transcript: bool = None):
+    """
+    Grade the conversation transcript and return the stored grade's report as JSON.
+    The transcript is only fetched from ElevenLabs when the client did not supply a usable one,
+    or when `verify_transcript` (default GRADING_VERIFY_TRANSCRIPT) asks to check it against the remote copy.
+    `on_progress(stage)` is called as each stage starts.
+    A conversation that already has a grade is not graded again; the stored grade is returned instead.
+    Each stage is timed into the `grading_stage_seconds` histogram, a structured log line and the grade's
+    stage_timings; create_grade's own time can only be logged, since it ends after the grade is written.
+    """
+    report = on_progress or (lambda stage: None)
+    verify = GRADING_VERIFY_TRANSCRIPT if verify_transcript is None else verify_transcript
+    started = time.perf_counter()
+    stages = {}
+
+    existing_grade = Grade.find_by_conversation_id(conversation_id)
+    if existing_grade:
+        logger.info(f"Conversation {conversation_id} is already graded; reusing grade {existing_grade.id}")
+        return json.dumps(serialize_grade_report(existing_grade))
+
+    formatted_transcript = format_transcript(transcript_from_user)
+    if not any(message["message"] for message in formatted_transcript):
+        report("fetching_conversation")
+        with timed_stage(stages, "fetch_conversation"):
+            formatted_transcript = fetch_remote_transcript(conversation_id)
+    elif verify:
+        report("verifying_transcript")
+        with timed_stage(stages, "fetch_conversation"):
+            remote_transcript = fetch_remote_transcript(conversation_id)
+        if remote_transcript and remote_transcript != formatted_transcript:
+            logger.warning(f"Supplied transcript for conversation {conversation_id} differs from ElevenLabs; "
+                           f"grading the ElevenLabs copy")
+            formatted_transcript = remote_transcript
+
+    if not formatted_transcript:
+        logger.error("Transcript is empty or missing")
+        return None
 
     user = User.find_by_email(user_email)
 
-    existing_log = ConversationLog.find_by_conversation_id(conversation_id)
-    if not existing_log:
-        ConversationLog.create_log(
-            user=user,
-            conversation_id=conversation_id,
-            case_study=case_study,
-            transcript=formatted_transcript
-        )
-    grading_response = infer(formatted_transcript, case_study.description)
+    report("logging_conversation")
+    with timed_stage(stages, "create_log"):
+        existing_log = ConversationLog.find_by_conversation_id(conversation_id)
+        if not existing_log:
+            ConversationLog.create_log(
+                user=user,
+                conversation_id=conversation_id,
+                case_study=case_study,
+                transcript=formatted_transcript
+            )
+    report("grading")
+    _, grading_result, usage = grade_transcript(formatted_transcript, case_study.description)
+    stages.update(usage["stages"])
 
+    report("saving_grade")
     try:
-        grading_result = json.loads(grading_response)
-    except:
-        print(grading_response)
-        grading_result = next(extract_json(grading_response))
+        with timed_stage(stages, "create_grade"):
+            grade = Grade.create_grade(
+                user=user,
+                conversation_id=conversation_id,
+                overall_summary=grading_result["overall_summary"],
+                final_score=grading_result["final_score"],
+                individual_scores=grading_result["individual_scores"],
+                performance_summary=grading_result["performance_summary"],
+                case_study=case_study,
+                prompt_version=GRADING_PROMPT_VERSION,
+                model=usage["model"],
+                input_tokens=usage["input_tokens"],
+                output_tokens=usage["output_tokens"],
+                stage_timings=dict(stages)
+            )
+    except NotUniqueError:
+        # Graded concurrently outside the single-flight claim, e.g. by a regrade; the first grade stands
+        logger.warning(f"Conversation {conversation_id} was graded concurrently; keeping the existing grade")
+        grade = Grade.find_by_conversation_id(conversation_id)
 
-    existing_grade = Grade.find_by_conversation_id(conversation_id)
-    if not existing_grade:
-        Grade.create_grade(
-            user=user,
-            conversation_id=conversation_id,
-            overall_summary=grading_result["overall_summary"] if "overall_summary" in grading_result else "",
-            final_score=int(grading_result["final_score"]) if "final_score" in grading_result else 0,
-            individual_scores=grading_result["individual_scores"] if "individual_scores" in grading_result else {},
-            performance_summary=grading_result["performance_summary"] if "performance_summary" in grading_result else {
-                "strengths": [], "weaknesses": []},
-            case_study=case_study
-        )
+    total = time.perf_counter() - started
+    observe("grading_total_seconds", total, mode=usage["mode"])
+    logger.info(f"Graded conversation {conversation_id} in {total:.2f}s", extra={"fields": {
+        "conversation_id": conversation_id,
+        "model": usage["model"],
+        "mode": usage["mode"],
+        "prompt_version": GRADING_PROMPT_VERSION,
+        "input_tokens": usage["input_tokens"],
+        "output_tokens": usage["output_tokens"],
+        "cached": usage["cached"],
+        "stages": stages,
+        "total_seconds": round(total, 3),
+    }})
+    # The grade that was kept, with the weighted final score, rather than the raw model response
+    return json.dumps(serialize_grade_report(grade))
+
+
+def process_grading_job(job: GradingJob, report):
+    """
+    Worker handler: grade the conversation a job refers to and return the grading response.
+    """
+    case_study = CaseStudy.objects(id=job.case_study_id).first()
+    if case_study is None:
+        raise JobFailed("Unable to grade: could not load case study information.")
+
+    grading_response = grade_conversation(job.conversation_id, job.user_email, case_study, job.transcript,
+                                          on_progress=report)
+    if grading_response is None:
+        raise JobFailed("Unable to grade: missing conversation transcripts")
 
     return grading_response
+
+
+grading_queue = create_job_queue(GRADING_QUEUE_BACKEND, visibility_timeout=GRADING_JOB_VISIBILITY_TIMEOUT)
+grading_workers = WorkerPool(grading_queue, process_grading_job, concurrency=GRADING_WORKER_CONCURRENCY,
+                             name="grading")
+
+
+def enqueue_grading(conversation_id: str, user_email: str, case_study: CaseStudy,
+                    transcript_from_user: list = None) -> GradingJob:
+    """
+    Queue a conversation for grading and return the job. Requests for a conversation that is already
+    queued, being graded or graded share that job (single-flight), so the model runs once per conversation.
+    Jobs are processed by `flask grading worker`; only with GRADING_EMBEDDED_WORKERS (or the local queue backend)
+    is an in-process pool started on first use.
+    """
+    job, created = grading_queue.enqueue_once(
+        f"grade:{conversation_id}",
+        conversation_id=conversation_id,
+        user_email=user_email,
+        case_study_id=str(case_study.id),
+        transcript=transcript_from_user or None,
+        max_attempts=GRADING_JOB_MAX_ATTEMPTS
+    )
+    if not created:
+        logger.info(f"Conversation {conversation_id} already has grading job {job.id} ({job.status.value})")
+    if GRADING_EMBEDDED_WORKERS or GRADING_QUEUE_BACKEND == "local":
+        # Also when the job is reused: it may have been queued before this process started
+        grading_workers.start()
+    return job
@@ -0,0 +1,104 @@
+import threading
+import time
+from concurrent.futures import Executor, Future, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, List
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    Raised when hedged calls have not all answered by their deadline.
+    """
+
+
+class HedgeLimiter:
+    """
+    Caps hedging so it cannot amplify load: at most `max_in_flight` hedges at once, and no more hedges
+    than `ratio` of the primary calls made so far (plus a small `burst` allowance to get started).
+    """
+
+    def __init__(self, max_in_flight: int = 4, ratio: float = 0.1, burst: int = 2):
+        self.max_in_flight = max_in_flight
+        self.ratio = ratio
+        self.burst = burst
+        self.calls = 0
+        self.hedges = 0
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def record_call(self):
+        with self._lock:
+            self.calls += 1
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self.in_flight >= self.max_in_flight or self.hedges >= self.calls * self.ratio + self.burst:
+                return False
+            self.in_flight += 1
+            self.hedges += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+
+def run_hedged(tasks: Dict[str, Callable[[bool], Any]], executor: Executor, deadline: float,
+               hedge_delay: Callable[[str], float], limiter: HedgeLimiter) -> Dict[str, Any]:
+    """
+    Run every task on `executor` and return their results by name. `task(hedge)` is called once as the
+    primary; if it hasn't answered `hedge_delay(name)` seconds later and the limiter allows, it is called
+    again as a hedge and whichever attempt succeeds first wins. A task fails only when all its attempts
+    have failed, with the first error. Raises DeadlineExceeded at `deadline` (a time.monotonic() value).
+    Attempts no longer needed, because their task was answered or the whole run failed, are cancelled if
+    they haven't started; attempts already running are abandoned.
+    """
+    started = time.monotonic()
+    attempts: Dict[str, List[Future]] = {}
+    hedge_at = {}
+    for name, task in tasks.items():
+        limiter.record_call()
+        attempts[name] = [executor.submit(task, False)]
+        hedge_at[name] = started + hedge_delay(name)
+
+    def cancel(names):
+        for name in names:
+            for attempt in attempts[name]:
+                attempt.cancel()
+
+    results = {}
+    while len(results) < len(tasks):
+        for name in tasks:
+            if name in results:
+                continue
+            succeeded = [f for f in attempts[name] if f.done() and f.exception() is None]
+            if succeeded:
+                results[name] = succeeded[0].result()
+                cancel([name])
+            elif all(f.done() for f in attempts[name]):
+                # Every attempt so far failed; a fast failure is reported, not hedged
+                cancel(tasks)
+                raise attempts[name][0].exception()
+        if len(results) == len(tasks):
+            break
+
+        now = time.monotonic()
+        if now >= deadline:
+            cancel(tasks)
+            raise DeadlineExceeded(f"{len(tasks) - len(results)} of {len(tasks)} calls unanswered at the deadline")
+
+        for name in [n for n in tasks if n not in results and n in hedge_at and now >= hedge_at[n]]:
+            del hedge_at[name]
+            if limiter.try_acquire():
+                hedge = executor.submit(tasks[name], True)
+                hedge.add_done_callback(lambda _: limiter.release())
+                attempts[name].append(hedge)
+
+        unanswered = [f for name in tasks if name not in results for f in attempts[name]]
+        if any(f.done() and f.exception() is None for f in unanswered):
+            # An attempt (e.g. a hedge just submitted) already answered; waiting only on the rest would miss it
+            continue
+        pending = [f for f in unanswered if not f.done()]
+        next_hedge = min([hedge_at[n] for n in tasks if n not in results and n in hedge_at], default=deadline)
+        wait(pending, timeout=max(min(next_hedge, deadline) - now, 0), return_when=FIRST_COMPLETED)
+
+    return results
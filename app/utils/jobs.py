@@ -0,0 +1,346 @@
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional, Tuple
+
+from bson import ObjectId
+
+from app.models import GradingJob, JobStatus, JobClaim
+from .logger import logger
+
+
+class JobFailed(Exception):
+    """
+    Raised by a job handler when retrying the job cannot succeed.
+    """
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class MongoJobQueue:
+    """
+    Job queue backed by the grading_jobs collection, safe to share between processes and nodes.
+    Workers claim jobs atomically; a claimed job stays invisible to other workers for
+    `visibility_timeout` seconds, extended every time the worker reports progress.
+    """
+
+    def __init__(self, visibility_timeout: float = 120, retry_backoff: float = 5, max_backoff: float = 300,
+                 claim_grace: float = 5):
+        self.visibility_timeout = visibility_timeout
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self.claim_grace = claim_grace
+
+    def retry_delay(self, attempts: int) -> timedelta:
+        return timedelta(seconds=min(self.retry_backoff * 2 ** max(attempts - 1, 0), self.max_backoff))
+
+    def enqueue(self, **fields) -> GradingJob:
+        job = GradingJob(**fields)
+        job.save()
+        return job
+
+    def get(self, job_id: str) -> Optional[GradingJob]:
+        return GradingJob.objects(id=job_id).first()
+
+    def enqueue_once(self, key: str, **fields) -> Tuple[GradingJob, bool]:
+        """
+        Single-flight enqueue. Returns (job, created): the job already owning `key` unless it failed,
+        otherwise a new job that takes the claim over. Queued, running and succeeded jobs are all reused,
+        so concurrent and repeated requests for the same work share one job and its result.
+        """
+        while True:
+            job_id = ObjectId()
+            claim = JobClaim.objects(key=key).modify(
+                upsert=True,
+                new=True,
+                set_on_insert__job_id=job_id,
+                set_on_insert__created_at=_now()
+            )
+            if claim.job_id == job_id:
+                return self.enqueue(id=job_id, **fields), True
+
+            job = self._await_job(claim.job_id)
+            if job is not None and job.status != JobStatus.FAILED:
+                return job, False
+
+            # The owner failed, or died between claiming and enqueueing: take the claim over
+            if JobClaim.objects(key=key, job_id=claim.job_id).update_one(set__job_id=job_id,
+                                                                         set__created_at=_now()):
+                return self.enqueue(id=job_id, **fields), True
+
+    def _await_job(self, job_id) -> Optional[GradingJob]:
+        """
+        The claim is taken just before its job is saved, so give a missing job `claim_grace` seconds to appear.
+        """
+        deadline = time.monotonic() + self.claim_grace
+        while True:
+            job = self.get(job_id)
+            if job is not None or time.monotonic() >= deadline:
+                return job
+            time.sleep(0.05)
+
+    def claim(self, worker_id: str) -> Optional[GradingJob]:
+        while True:
+            now = _now()
+            job = GradingJob.objects(
+                status__in=[JobStatus.QUEUED, JobStatus.RUNNING],
+                visible_at__lte=now
+            ).order_by('visible_at').modify(
+                new=True,
+                set__status=JobStatus.RUNNING,
+                set__worker=worker_id,
+                set__visible_at=now + timedelta(seconds=self.visibility_timeout),
+                set__updated_at=now,
+                inc__attempts=1
+            )
+            if job is None or job.attempts <= job.max_attempts:
+                return job
+
+            # Its worker went silent on every allowed attempt
+            self._finish(job, JobStatus.FAILED, error="Job timed out on every attempt")
+
+    def heartbeat(self, job: GradingJob, progress: str) -> bool:
+        now = _now()
+        job.progress = progress
+        return bool(GradingJob.objects(id=job.id, worker=job.worker, attempts=job.attempts).update_one(
+            set__progress=progress,
+            set__visible_at=now + timedelta(seconds=self.visibility_timeout),
+            set__updated_at=now
+        ))
+
+    def complete(self, job: GradingJob, result: str) -> bool:
+        return self._finish(job, JobStatus.SUCCEEDED, result=result)
+
+    def fail(self, job: GradingJob, error: str, retry: bool = True) -> bool:
+        if retry and job.attempts < job.max_attempts:
+            now = _now()
+            return bool(GradingJob.objects(id=job.id, worker=job.worker, attempts=job.attempts).update_one(
+                set__status=JobStatus.QUEUED,
+                set__error=error,
+                set__visible_at=now + self.retry_delay(job.attempts),
+                set__updated_at=now
+            ))
+        return self._finish(job, JobStatus.FAILED, error=error)
+
+    def _finish(self, job: GradingJob, status: JobStatus, result: str = None, error: str = None) -> bool:
+        now = _now()
+        return bool(GradingJob.objects(id=job.id, worker=job.worker, attempts=job.attempts).update_one(
+            set__status=status,
+            set__result=result,
+            set__error=error,
+            set__finished_at=now,
+            set__updated_at=now
+        ))
+
+
+class LocalJobQueue(MongoJobQueue):
+    """
+    In-process stand-in for MongoJobQueue with the same claim, visibility and retry semantics.
+    Jobs are kept in memory and never saved, which makes it suitable for tests and single-process runs.
+    Like a document read from Mongo, each claim returns its own copy of the job, and writes through it are
+    ignored once the job was claimed again, so a worker whose claim expired can't finish or requeue it.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._jobs = {}
+        self._claims = {}
+        self._lock = threading.Lock()
+
+    def enqueue(self, **fields) -> GradingJob:
+        fields.setdefault('id', ObjectId())
+        job = GradingJob(**fields)
+        with self._lock:
+            self._jobs[str(job.id)] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[GradingJob]:
+        return self._jobs.get(str(job_id))
+
+    def enqueue_once(self, key: str, **fields) -> Tuple[GradingJob, bool]:
+        with self._lock:
+            job = self._jobs.get(str(self._claims.get(key)))
+            if job is not None and job.status != JobStatus.FAILED:
+                return job, False
+            job = GradingJob(id=ObjectId(), **fields)
+            self._jobs[str(job.id)] = job
+            self._claims[key] = job.id
+        return job, True
+
+    def claim(self, worker_id: str) -> Optional[GradingJob]:
+        with self._lock:
+            while True:
+                now = _now()
+                claimable = [
+                    job for job in self._jobs.values()
+                    if job.status in (JobStatus.QUEUED, JobStatus.RUNNING) and job.visible_at <= now
+                ]
+                if not claimable:
+                    return None
+
+                job = min(claimable, key=lambda j: j.visible_at)
+                job.status = JobStatus.RUNNING
+                job.worker = worker_id
+                job.visible_at = now + timedelta(seconds=self.visibility_timeout)
+                job.updated_at = now
+                job.attempts += 1
+                if job.attempts <= job.max_attempts:
+                    return GradingJob._from_son(job.to_mongo())
+
+                job.status = JobStatus.FAILED
+                job.error = "Job timed out on every attempt"
+                job.finished_at = now
+
+    def _owned(self, job: GradingJob) -> Optional[GradingJob]:
+        """
+        The stored job if `job` is still its current claim, the equivalent of MongoJobQueue's
+        worker and attempts filter. Call with the lock held.
+        """
+        stored = self._jobs.get(str(job.id))
+        if stored is None or (stored.worker, stored.attempts) != (job.worker, job.attempts):
+            return None
+        return stored
+
+    def heartbeat(self, job: GradingJob, progress: str) -> bool:
+        job.progress = progress
+        with self._lock:
+            stored = self._owned(job)
+            if stored is None:
+                return False
+            stored.progress = progress
+            stored.visible_at = _now() + timedelta(seconds=self.visibility_timeout)
+            stored.updated_at = _now()
+            return True
+
+    def fail(self, job: GradingJob, error: str, retry: bool = True) -> bool:
+        if retry and job.attempts < job.max_attempts:
+            with self._lock:
+                stored = self._owned(job)
+                if stored is None:
+                    return False
+                stored.status = JobStatus.QUEUED
+                stored.error = error
+                stored.visible_at = _now() + self.retry_delay(job.attempts)
+                stored.updated_at = _now()
+            return True
+        return self._finish(job, JobStatus.FAILED, error=error)
+
+    def _finish(self, job: GradingJob, status: JobStatus, result: str = None, error: str = None) -> bool:
+        with self._lock:
+            stored = self._owned(job)
+            if stored is None:
+                return False
+            stored.status = status
+            stored.result = result
+            stored.error = error
+            stored.finished_at = _now()
+            stored.updated_at = stored.finished_at
+        return True
+
+
+def create_job_queue(backend: str, **kwargs):
+    """
+    Build the queue for the configured backend ("mongo" or "local").
+    """
+    if backend == "local":
+        return LocalJobQueue(**kwargs)
+    if backend == "mongo":
+        return MongoJobQueue(**kwargs)
+    raise ValueError(f"Unknown job queue backend: {backend}")
+
+
+class WorkerPool:
+    """
+    Fixed-size pool of threads that claim jobs from a queue and run `handler(job, report)` on them.
+    `report(stage)` records progress and keeps the job claimed; a heartbeat also renews the claim every third of
+    the visibility timeout while the handler runs, so a long stage isn't taken for a dead worker.
+    The handler's return value is stored as the job result; JobFailed fails the job immediately, any other
+    exception schedules a retry.
+    """
+
+    def __init__(self, queue, handler: Callable, concurrency: int = 4, poll_interval: float = 1.0,
+                 name: str = "worker"):
+        self.queue = queue
+        self.handler = handler
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.name = name
+        self._threads = []
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return any(thread.is_alive() for thread in self._threads)
+
+    def start(self):
+        with self._lock:
+            if self.running:
+                return
+            self._stop.clear()
+            self._threads = [
+                threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+                for i in range(self.concurrency)
+            ]
+            for thread in self._threads:
+                thread.start()
+            logger.info(f"Started {self.concurrency} {self.name} workers")
+
+    def stop(self, timeout: float = None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+    def run_once(self, worker_id: str) -> bool:
+        """
+        Claim and process a single job. Returns False when no job was available.
+        """
+        job = self.queue.claim(worker_id)
+        if job is None:
+            return False
+
+        finished = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job, finished),
+                                     name=f"{threading.current_thread().name}-heartbeat", daemon=True)
+        heartbeat.start()
+        try:
+            result = self.handler(job, lambda stage: self.queue.heartbeat(job, stage))
+            finished.set()
+            self.queue.complete(job, result)
+        except JobFailed as e:
+            logger.error(f"{self.name} job {job.id} failed: {str(e)}")
+            self.queue.fail(job, str(e), retry=False)
+        except Exception as e:
+            logger.error(f"{self.name} job {job.id} attempt {job.attempts} failed: {str(e)}")
+            self.queue.fail(job, str(e), retry=True)
+        finally:
+            finished.set()
+        return True
+
+    def _heartbeat(self, job, finished: threading.Event):
+        interval = self.queue.visibility_timeout / 3
+        while not finished.wait(interval):
+            try:
+                if not self.queue.heartbeat(job, job.progress or "running"):
+                    logger.warning(f"{self.name} job {job.id} was claimed by another worker")
+                    return
+            except Exception as e:
+                logger.error(f"{self.name} job {job.id} heartbeat failed: {str(e)}")
+
+    def _run(self):
+        worker_id = f"{socket.gethostname()}:{threading.current_thread().name}:{uuid.uuid4().hex[:8]}"
+        while not self._stop.is_set():
+            try:
+                if not self.run_once(worker_id):
+                    self._stop.wait(self.poll_interval)
+            except Exception as e:
+                logger.error(f"{self.name} worker {worker_id} error: {str(e)}")
+                self._stop.wait(self.poll_interval)
@@ -1,4 +1,4 @@
-from app.models import User
+from app.models import User, Session
 from ..utils.logger import logger
 from functools import wraps
 import os
@@ -7,38 +7,65 @@ from flask import jsonify, request, g
 import jwt
 from contextlib import contextmanager
 
+
+def get_bearer_token():
+    """
+    Read the JWT from the Authorization header, with or without the Bearer prefix.
+    """
+    token = request.headers.get('Authorization')
+    if token and token.startswith('Bearer '):
+        token = token.replace('Bearer ', '', 1)
+    return token or None
+
+
+def resolve_auth():
+    """
+    Decode the request token once and resolve the user and their active session together.
+    The result is memoised on `g` so the before_request hook and `token_required` share it:
+        g.auth_claims -> decoded token payload (None when no token was sent)
+        g.auth_user   -> User for the token email, served from the user cache
+        g.user_info   -> active Session for the token email
+    Raises the jwt exceptions when the token is invalid or expired.
+    """
+    if g.get('auth_resolved'):
+        return g.auth_user
+
+    g.auth_claims = None
+    g.auth_user = None
+    g.user_info = None
+
+    token = get_bearer_token()
+    if token:
+        claims = jwt.decode(token, os.getenv('JWT_SECRET'), algorithms=['HS256'])
+        email = claims.get('email')
+
+        g.auth_claims = claims
+        if email:
+            g.auth_user = User.find_cached_by_email(email)
+            g.user_info = Session.find_active_by_email(email)
+
+    g.auth_resolved = True
+    return g.auth_user
+
+
 def token_required(f):
     @wraps(f)
-    def decorated(*args, **kwargs):        
-        AUTH_HEADER = 'Authorization'
-        token = None
-      
-        if AUTH_HEADER in request.headers:
-            token = request.headers[AUTH_HEADER]
-      
-        if not token:
+    def decorated(*args, **kwargs):
+        if not get_bearer_token():
             return jsonify({'message' : 'Token is missing!'}), 401
-  
-        if token.startswith('Bearer '):
-            token = token.replace('Bearer ', '', 1)
-       
-  
-        data = jwt.decode(token, os.getenv('JWT_SECRET'), algorithms=['HS256'])
-        email = data.get('email')
-        if not email:
+
+        user = resolve_auth()
+        if not g.auth_claims.get('email'):
             return jsonify({'message': 'Email not found in token'}), 401
-        
-        user = User.find_by_email(email) 
-        
+
         if not user:
             return jsonify({'message' : 'User not found!'}), 401
-        
-    
+
         request.current_user = user
         logger.info(f"User {user.email} is authenticated")
         with token_data_context(user):
             return f( *args, **kwargs)
-        
+
     return decorated
 
 
@@ -49,4 +76,4 @@ def token_data_context(user):
         g.data = user
         yield
     finally:
-        del g.data
\ No newline at end of file
+        del g.data
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from typing import List
+
+from app.models import GradingReport, SCORE_CRITERIA
+from .hedging import DeadlineExceeded
+
+# Per-call latency is lognormal around the median; SIGMA widens the tail (0 makes every call take the median)
+LOCAL_GRADER_LATENCY_MEDIAN = float(os.getenv("GRADING_LOCAL_LATENCY_MEDIAN", 2.0))
+LOCAL_GRADER_LATENCY_SIGMA = float(os.getenv("GRADING_LOCAL_LATENCY_SIGMA", 0.5))
+# Fraction of calls that fail like an overloaded upstream, and that answer with text that isn't a report
+LOCAL_GRADER_ERROR_RATE = float(os.getenv("GRADING_LOCAL_ERROR_RATE", 0))
+LOCAL_GRADER_MALFORMED_RATE = float(os.getenv("GRADING_LOCAL_MALFORMED_RATE", 0))
+LOCAL_GRADER_SEED = int(os.getenv("GRADING_LOCAL_SEED", 0))
+
+
+class LocalGraderError(Exception):
+    """
+    Simulated upstream failure. Carries a 503 `code` like the API errors it stands in for.
+    """
+    code = 503
+
+
+class LocalGrader:
+    """
+    Offline grader for load tests: no network and no spend. Scores and feedback are derived from a hash
+    of the transcript, so the same transcript always gets the same report. Latency, errors and malformed
+    responses are drawn from one random stream seeded with GRADING_LOCAL_SEED, so a run is reproducible
+    in aggregate while retries of a failed call can still succeed.
+    """
+    model = "local-stub"
+
+    def __init__(self, latency_median: float = LOCAL_GRADER_LATENCY_MEDIAN,
+                 latency_sigma: float = LOCAL_GRADER_LATENCY_SIGMA, error_rate: float = LOCAL_GRADER_ERROR_RATE,
+                 malformed_rate: float = LOCAL_GRADER_MALFORMED_RATE, seed: int = LOCAL_GRADER_SEED):
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _draw(self, calls: int) -> List[tuple]:
+        with self._lock:
+            return [(self.latency_median * self._random.lognormvariate(0, self.latency_sigma),
+                     self._random.random()) for _ in range(calls)]
+
+    @staticmethod
+    def report(transcript_text: str) -> dict:
+        """
+        The deterministic, schema-valid report for a transcript.
+        """
+        digest = hashlib.sha256(transcript_text.encode()).digest()
+        scores = {criterion: 40 + digest[i] % 61 for i, criterion in enumerate(SCORE_CRITERIA)}
+        names = {criterion: criterion.replace("_", " ") for criterion in SCORE_CRITERIA}
+        best = max(scores, key=scores.get)
+        worst = min(scores, key=scores.get)
+        return GradingReport(
+            overall_summary=f"Stub assessment of a {len(transcript_text.splitlines())} turn conversation.",
+            final_score=round(sum(scores.values()) / len(scores)),
+            individual_scores=scores,
+            individual_score_justifications={
+                criterion: f"Stub score of {score} for {names[criterion]}." for criterion, score in scores.items()
+            },
+            performance_summary={
+                "strengths": [{"title": names[best].capitalize(),
+                               "description": f"Your strongest criterion was {names[best]}."}],
+                "weaknesses": [{"title": names[worst].capitalize(), "description": f"Work on {names[worst]} next."}],
+            }
+        ).model_dump()
+
+    def grade(self, transcript_text: str, case_study_summary: str, mode: str, timings: List[dict],
+              deadline: float) -> str:
+        """
+        Simulate the model calls of `mode` concurrently and return the report as the response text.
+        Raises LocalGraderError or DeadlineExceeded when the draws say so.
+        """
+        calls = ["grade"] if mode == "single" else [*SCORE_CRITERIA, "summary"]
+        draws = self._draw(len(calls))
+        latency = max(seconds for seconds, _ in draws)
+        remaining = deadline - time.monotonic()
+        time.sleep(max(min(latency, remaining), 0))
+
+        for call, (seconds, roll) in zip(calls, draws):
+            outcome = "error" if roll < self.error_rate or seconds > remaining else "ok"
+            timings.append({"call": call, "seconds": round(min(seconds, remaining), 3), "wait": 0.0,
+                            "outcome": outcome, "hedge": False})
+        if latency > remaining:
+            raise DeadlineExceeded(f"Local grader latency {latency:.2f}s is past the deadline")
+
+        roll = min(roll for _, roll in draws)
+        if roll < self.error_rate:
+            raise LocalGraderError("Simulated upstream failure")
+        if roll < self.error_rate + self.malformed_rate:
+            return "I'm sorry, I can't produce a grade for this conversation."
+        return json.dumps(self.report(transcript_text))
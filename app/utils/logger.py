@@ -12,7 +12,9 @@ class JSONFormatter(logging.Formatter):
             "function": record.funcName,
             "line": record.lineno,
         }
-        return json.dumps(log_record)
+        # Structured fields passed as logger.info(..., extra={"fields": {...}})
+        log_record.update(getattr(record, "fields", None) or {})
+        return json.dumps(log_record, default=str)
 
 def setup_logger():
   
@@ -0,0 +1,149 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Optional
+
+from bson import ObjectId
+
+from app.models import CaseStudy, ConversationLog, Grade, GradeDailyRollup, Session, User, UserRole, SCORE_CRITERIA
+from .cache import TTLCache
+
+metrics_cache = TTLCache(maxsize=256, ttl=float(os.getenv("METRICS_CACHE_TTL", 30)))
+metrics_executor = ThreadPoolExecutor(max_workers=5, thread_name_prefix="metrics")
+
+GRANULARITIES = ("day", "week", "month")
+
+
+def parse_date(value: Optional[str]) -> Optional[datetime]:
+    """
+    Parse an ISO-8601 query parameter, the same way for every collection.
+    """
+    return datetime.fromisoformat(value) if value else None
+
+
+def date_range(field: str, start: Optional[datetime], end: Optional[datetime]) -> dict:
+    bounds = {}
+    if start:
+        bounds["$gte"] = start
+    if end:
+        bounds["$lte"] = end
+    return {field: bounds} if bounds else {}
+
+
+def _grade_facets(match: dict) -> dict:
+    result = list(Grade._get_collection().aggregate([
+        {"$match": match},
+        {
+            "$facet": {
+                "summary": [
+                    {"$group": {"_id": None, "total_grades": {"$sum": 1}, "average_score": {"$avg": "$final_score"}}}
+                ],
+                "by_case_study": [
+                    {"$group": {"_id": "$case_study", "count": {"$sum": 1}}}
+                ],
+            }
+        }
+    ]))
+    return result[0] if result else {"summary": [], "by_case_study": []}
+
+
+def aggregate_metrics(case_study_id: Optional[str] = None, start_date: Optional[str] = None,
+                      end_date: Optional[str] = None) -> dict:
+    """
+    Compute the faculty dashboard metrics with one $facet pipeline on grades and one count per other
+    collection, all issued concurrently. Results are cached briefly per normalized filter set.
+    """
+    start, end = parse_date(start_date), parse_date(end_date)
+    cache_key = (case_study_id or None, start.isoformat() if start else None, end.isoformat() if end else None)
+
+    cached = metrics_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    activity_match = date_range("timestamp", start, end)
+    session_match = date_range("start_time", start, end)
+    if case_study_id:
+        activity_match["case_study"] = ObjectId(case_study_id)
+        session_match["case_study_id"] = case_study_id
+
+    grades = metrics_executor.submit(_grade_facets, activity_match)
+    conversations = metrics_executor.submit(ConversationLog._get_collection().count_documents, activity_match)
+    sessions = metrics_executor.submit(Session._get_collection().count_documents, session_match)
+    students = metrics_executor.submit(User._get_collection().count_documents, {"role": UserRole.STUDENT.value})
+    case_studies = metrics_executor.submit(CaseStudy._get_collection().estimated_document_count)
+
+    facets = grades.result()
+    summary = facets["summary"][0] if facets["summary"] else {}
+    average_score = summary.get("average_score")
+
+    metrics = {
+        "total_students": students.result(),
+        "total_case_studies": case_studies.result(),
+        "total_conversations": conversations.result(),
+        "total_sessions": sessions.result(),
+        "total_grades": summary.get("total_grades", 0),
+        "average_score": round(average_score, 2) if average_score else 0,
+        "total_case_studies_completed": sum(item["count"] for item in facets["by_case_study"]),
+    }
+
+    metrics_cache.set(cache_key, metrics)
+    return metrics
+
+
+def bucket_of(day: datetime, granularity: str) -> str:
+    """
+    Label of the day, week (starting Monday) or month bucket a rollup day falls into.
+    """
+    if granularity == "week":
+        return (day - timedelta(days=day.weekday())).strftime("%Y-%m-%d")
+    if granularity == "month":
+        return day.strftime("%Y-%m")
+    return day.strftime("%Y-%m-%d")
+
+
+def grade_timeseries(case_study_id: Optional[str] = None, start_date: Optional[str] = None,
+                     end_date: Optional[str] = None, granularity: str = "day") -> list:
+    """
+    Build the grade time series from the daily rollups, merged into day, week or month buckets.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unsupported granularity: {granularity}")
+
+    start, end = parse_date(start_date), parse_date(end_date)
+    match = date_range(
+        "day",
+        GradeDailyRollup.day_of(start) if start else None,
+        GradeDailyRollup.day_of(end) if end else None
+    )
+    if case_study_id:
+        match["case_study"] = ObjectId(case_study_id)
+
+    buckets = {}
+    for rollup in GradeDailyRollup._get_collection().find(match):
+        bucket = buckets.setdefault(bucket_of(rollup["day"], granularity), {
+            "total_grades": 0,
+            "final_score_sum": 0,
+            "score_sums": dict.fromkeys(SCORE_CRITERIA, 0),
+            "score_counts": dict.fromkeys(SCORE_CRITERIA, 0),
+        })
+        bucket["total_grades"] += rollup.get("total_grades", 0)
+        bucket["final_score_sum"] += rollup.get("final_score_sum", 0)
+        for criterion in SCORE_CRITERIA:
+            bucket["score_sums"][criterion] += rollup.get("score_sums", {}).get(criterion, 0)
+            bucket["score_counts"][criterion] += rollup.get("score_counts", {}).get(criterion, 0)
+
+    def average(total, count):
+        return total / count if count else None
+
+    return [
+        {
+            "date": label,
+            "average_score": average(bucket["final_score_sum"], bucket["total_grades"]),
+            "total_grades": bucket["total_grades"],
+            **{
+                f"{criterion}_score": average(bucket["score_sums"][criterion], bucket["score_counts"][criterion])
+                for criterion in SCORE_CRITERIA
+            },
+        }
+        for label, bucket in sorted(buckets.items())
+    ]
@@ -0,0 +1,76 @@
+import base64
+from typing import List, Optional, Tuple
+
+from bson import json_util
+from mongoengine import Q
+
+
+def encode_cursor(values: list) -> str:
+    """
+    Encode the sort-key values of the last returned row into an opaque cursor.
+    """
+    return base64.urlsafe_b64encode(json_util.dumps(values).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> list:
+    """
+    Decode a cursor produced by `encode_cursor`. Raises ValueError when it is malformed.
+    """
+    try:
+        values = json_util.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def _sort_spec(document, order_by: List[str]) -> List[Tuple[str, str, int]]:
+    spec = []
+    for key in order_by:
+        direction = -1 if key.startswith('-') else 1
+        name = key.lstrip('+-')
+        spec.append((name, document._fields[name].db_field, direction))
+    return spec
+
+
+def keyset_filter(spec: List[Tuple[str, str, int]], values: list) -> Q:
+    """
+    Build the query matching rows strictly after `values` in the sort order, e.g.
+    for ascending (a, b): Q(a__gt=va) | (Q(a=va) & Q(b__gt=vb))
+    """
+    if len(values) != len(spec):
+        raise ValueError("Invalid cursor")
+
+    query = None
+    for i, (name, _, direction) in enumerate(spec):
+        clause = Q(**{f"{name}__{'gt' if direction > 0 else 'lt'}": values[i]})
+        for j, (prev_name, _, _) in enumerate(spec[:i]):
+            clause &= Q(**{prev_name: values[j]})
+        query = clause if query is None else query | clause
+    return query
+
+
+def paginate(queryset, order_by: List[str], per_page: int, page: int = 1, cursor: Optional[str] = None):
+    """
+    Page through a queryset (documents or `as_pymongo` rows) ordered by a unique, stable key.
+    With a cursor the page is fetched by seeking on the sort key, so deep pages cost the same as the
+    first one; without one it falls back to page/per_page offsets.
+    Returns (items, next_cursor); next_cursor is None on the last page.
+    """
+    spec = _sort_spec(queryset._document, order_by)
+    queryset = queryset.order_by(*order_by)
+
+    if cursor:
+        queryset = queryset.filter(keyset_filter(spec, decode_cursor(cursor)))
+    elif page > 1:
+        queryset = queryset.skip((page - 1) * per_page)
+
+    items = list(queryset.limit(per_page + 1))
+    if len(items) <= per_page:
+        return items, None
+
+    items = items[:per_page]
+    last = items[-1] if isinstance(items[-1], dict) else items[-1].to_mongo()
+    return items, encode_cursor([last.get(db_field) for _, db_field, _ in spec])
@@ -1,24 +1,105 @@
 import json
+import re
+from typing import Iterator, List, Optional, Tuple, Type, TypeVar
 
+from pydantic import BaseModel, ValidationError
 
-def RawJSONDecoder(index):
-    class _RawJSONDecoder(json.JSONDecoder):
-        end = None
+Model = TypeVar("Model", bound=BaseModel)
 
-        def decode(self, s, *_):
-            data, self.__class__.end = self.raw_decode(s, index)
-            return data
+# The only characters that affect object boundaries; an escape pair is one token so escaped quotes are skipped
+_STRUCTURE = re.compile(r'\\.|["{}]', re.DOTALL)
 
-    return _RawJSONDecoder
 
+def _object_spans(s: str) -> Tuple[List[Tuple[int, int]], List[Tuple[int, int]]]:
+    """
+    One pass over `s` that returns the spans of balanced {...} objects, ignoring braces inside strings.
+    Returns (top-level spans, spans nested directly inside a brace that is never closed), each in order.
+    """
+    top_level, orphaned = [], []
+    stack, parents = [], []
+    in_string = False
 
-def extract_json(s, index=0):
-    while (index := s.find('{', index)) != -1:
+    for match in _STRUCTURE.finditer(s):
+        char, i = match.group(), match.start()
+        if in_string:
+            if char == '"':
+                in_string = False
+        elif char == '{':
+            stack.append(i)
+        elif not stack:
+            continue
+        elif char == '"':
+            in_string = True
+        elif char == '}':
+            start = stack.pop()
+            if stack:
+                parents.append((stack[-1], start, i + 1))
+            else:
+                top_level.append((start, i + 1))
+
+    if stack:
+        # An unclosed brace (prose like "use {" or a truncated object) swallows everything after it;
+        # fall back to the complete objects directly inside it.
+        unclosed = set(stack)
+        orphaned = [(start, end) for parent, start, end in parents if parent in unclosed]
+        orphaned.sort()
+    return top_level, orphaned
+
+
+_decoder = json.JSONDecoder()
+
+
+def extract_json(s: str, index: int = 0) -> Iterator[dict]:
+    """
+    Yield every JSON object embedded in `s` (from `index`), in linear time. Balanced candidates that
+    fail to parse are skipped as a whole rather than retried from each inner brace.
+    """
+    # Fast path for the usual case, whole objects between prose: one decode at each next brace
+    while True:
+        index = s.find('{', index)
+        if index == -1:
+            return
+        try:
+            value, end = _decoder.raw_decode(s, index)
+        except (json.JSONDecodeError, RecursionError):
+            break
+        if not isinstance(value, dict):
+            break
+        yield value
+        index = end
+
+    text = s[index:]
+    top_level, orphaned = _object_spans(text)
+    for start, end in top_level + orphaned:
         try:
-            yield json.loads(s, cls=(decoder := RawJSONDecoder(index)))
-            index = decoder.end
+            value = json.loads(text[start:end])
         except json.JSONDecodeError:
-            index += 1
+            continue
+        if isinstance(value, dict):
+            yield value
+
+
+def first_json_object(s: str) -> Optional[dict]:
+    return next(extract_json(s), None)
+
+
+def parse_json_object(s: str, model: Type[Model]) -> Model:
+    """
+    Parse a model response into `model`: the whole text as JSON, or else the first embedded object.
+    Raises ValueError with a short reason when no object is found or it doesn't validate.
+    """
+    try:
+        data = json.loads(s)
+    except (TypeError, json.JSONDecodeError):
+        data = first_json_object(s or "")
+        if data is None:
+            raise ValueError(f"No JSON object found in response of {len(s or '')} characters")
+
+    try:
+        return model.model_validate(data)
+    except ValidationError as e:
+        errors = "; ".join(f"{'.'.join(str(p) for p in error['loc'])}: {error['msg']}" for error in e.errors()[:5])
+        raise ValueError(f"Invalid {model.__name__}: {errors}") from None
 
 
 def remove_none(value):
@@ -0,0 +1,36 @@
+from bson import DBRef
+from mongoengine import Document
+
+
+def _reference_id(value):
+    if isinstance(value, DBRef):
+        return value.id
+    if isinstance(value, Document):
+        return value.pk
+    return value
+
+
+def prefetch_references(documents, *fields: str) -> list:
+    """
+    Resolve ReferenceFields for a whole result set with one `$in` query per referenced collection,
+    instead of one query per document on first attribute access.
+    Example:
+        grades = prefetch_references(Grade.objects(user=user), 'user', 'case_study')
+        grades[0].case_study.title  # no extra query
+    References that point at deleted documents resolve to None.
+    """
+    documents = list(documents)
+    if not documents:
+        return documents
+
+    for name in fields:
+        document_type = type(documents[0])._fields[name].document_type
+        ids = {_reference_id(doc._data.get(name)) for doc in documents} - {None}
+        fetched = {ref.pk: ref for ref in document_type.objects(pk__in=list(ids))} if ids else {}
+
+        for doc in documents:
+            ref_id = _reference_id(doc._data.get(name))
+            # Written to _data directly so the document is not marked as changed
+            doc._data[name] = fetched.get(ref_id) if ref_id is not None else None
+
+    return documents
@@ -0,0 +1,213 @@
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional
+
+from pymongo import ReturnDocument
+
+from app.models import RateLimitBucket
+from .logger import logger
+from .telemetry import observe
+
+# Upstream statuses that mean "slow down": quota exhaustion and overload
+THROTTLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RateLimitTimeout(TimeoutError):
+    """
+    Raised when a call could not get capacity before its timeout.
+    """
+
+
+class LocalTokenBucket:
+    """
+    In-process token bucket over two dimensions, requests per minute and tokens per minute.
+    Both buckets start full and refill continuously; a take succeeds only if both can pay.
+    """
+
+    def __init__(self, rpm: float, tpm: float):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = rpm
+        self.tokens = tpm
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_take(self, tokens: int, requests: int = 1) -> float:
+        """
+        Take `requests` requests and `tokens` tokens. Returns 0 on success, otherwise the seconds until they refill.
+        """
+        tokens = min(tokens, self.tpm)
+        requests = min(requests, self.rpm)
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self.updated
+            self.updated = now
+            self.requests = min(self.rpm, self.requests + elapsed * self.rpm / 60)
+            self.tokens = min(self.tpm, self.tokens + elapsed * self.tpm / 60)
+            if self.requests >= requests and self.tokens >= tokens:
+                self.requests -= requests
+                self.tokens -= tokens
+                return 0.0
+            return max((requests - self.requests) * 60 / self.rpm, (tokens - self.tokens) * 60 / self.tpm, 0.0)
+
+
+class MongoTokenBucket:
+    """
+    Token bucket shared by every process and node through one rate_limit_buckets document.
+    Refill and take happen in a single atomic pipeline update, so concurrent callers never overspend.
+    """
+
+    def __init__(self, key: str, rpm: float, tpm: float):
+        self.key = key
+        self.rpm = rpm
+        self.tpm = tpm
+        self._initialised = False
+
+    def _ensure(self):
+        if not self._initialised:
+            RateLimitBucket.objects(key=self.key).update_one(
+                upsert=True,
+                set_on_insert__requests=self.rpm,
+                set_on_insert__tokens=self.tpm,
+                set_on_insert__updated_at=datetime.now(timezone.utc)
+            )
+            self._initialised = True
+
+    def try_take(self, tokens: int, requests: int = 1) -> float:
+        self._ensure()
+        tokens = min(tokens, self.tpm)
+        requests = min(requests, self.rpm)
+        grant = uuid.uuid4().hex
+        elapsed_ms = {"$max": [{"$subtract": ["$$NOW", "$updated_at"]}, 0]}
+        refilled_requests = {"$min": [self.rpm, {"$add": ["$requests", {"$multiply": [elapsed_ms, self.rpm / 60000]}]}]}
+        refilled_tokens = {"$min": [self.tpm, {"$add": ["$tokens", {"$multiply": [elapsed_ms, self.tpm / 60000]}]}]}
+        granted = {"$eq": ["$grant", grant]}
+        bucket = RateLimitBucket._get_collection().find_one_and_update(
+            {"key": self.key},
+            [
+                {"$set": {"requests": refilled_requests, "tokens": refilled_tokens, "updated_at": "$$NOW"}},
+                {"$set": {"grant": {"$cond": [
+                    {"$and": [{"$gte": ["$requests", requests]}, {"$gte": ["$tokens", tokens]}]}, grant, None
+                ]}}},
+                {"$set": {
+                    "requests": {"$cond": [granted, {"$subtract": ["$requests", requests]}, "$requests"]},
+                    "tokens": {"$cond": [granted, {"$subtract": ["$tokens", tokens]}, "$tokens"]},
+                }},
+            ],
+            return_document=ReturnDocument.AFTER
+        )
+        if bucket.get("grant") == grant:
+            return 0.0
+        return max((requests - bucket["requests"]) * 60 / self.rpm, (tokens - bucket["tokens"]) * 60 / self.tpm, 0.0)
+
+
+def create_token_bucket(backend: str, key: str, rpm: float, tpm: float):
+    """
+    Build the bucket for the configured backend ("mongo" or "local").
+    """
+    if backend == "local":
+        return LocalTokenBucket(rpm, tpm)
+    if backend == "mongo":
+        return MongoTokenBucket(key, rpm, tpm)
+    raise ValueError(f"Unknown rate limit backend: {backend}")
+
+
+def wait_for_capacity(bucket, tokens: int = 0, requests: int = 1, deadline: Optional[float] = None) -> bool:
+    """
+    Block until `bucket` grants `requests` and `tokens`. Between attempts it sleeps for the wait the bucket
+    reports, plus up to half again as jitter, so waiting callers spread out instead of polling a shared
+    bucket. Returns False when that can't happen by `deadline` (a time.monotonic() value).
+    """
+    while (wait := bucket.try_take(tokens, requests)) > 0:
+        wait *= random.uniform(1.0, 1.5)
+        if deadline is not None and time.monotonic() + wait > deadline:
+            return False
+        time.sleep(wait)
+    return True
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD limit on concurrent calls: each success adds 1/limit (about +1 per round of calls), each throttle
+    halves the limit, at most once per `cooldown` seconds so one burst of rejections counts once.
+    """
+
+    def __init__(self, initial: float = 4, minimum: float = 1, maximum: float = 32, cooldown: float = 5):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._decreased_at = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        with self._condition:
+            if not self._condition.wait_for(lambda: self.in_flight < int(self.limit), timeout):
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self, throttled: bool = False):
+        with self._condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                if now - self._decreased_at >= self.cooldown:
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self._decreased_at = now
+                    logger.warning(f"Upstream throttling, concurrency limit lowered to {int(self.limit)}")
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+def is_throttle(error: Exception) -> bool:
+    status = getattr(error, "code", None) or getattr(error, "status_code", None)
+    return status in THROTTLE_STATUSES
+
+
+class RateLimiter:
+    """
+    Gate for calls to a rate-limited upstream: an adaptive concurrency slot in this process, then
+    one request and the estimated tokens from the (shared) token bucket, waiting as long as the bucket says.
+    Time spent waiting for both is recorded in the `rate_limit_wait_seconds` histogram.
+    Example:
+        with limiter.limit(tokens=1200):
+            client.models.generate_content(...)
+    """
+
+    def __init__(self, name: str, bucket, concurrency: AdaptiveConcurrency):
+        self.name = name
+        self.bucket = bucket
+        self.concurrency = concurrency
+
+    @contextmanager
+    def limit(self, tokens: int = 0, timeout: Optional[float] = None):
+        start = time.monotonic()
+        deadline = start + timeout if timeout is not None else None
+
+        def remaining():
+            return None if deadline is None else max(deadline - time.monotonic(), 0)
+
+        if not self.concurrency.acquire(remaining()):
+            observe("rate_limit_wait_seconds", time.monotonic() - start, limiter=self.name, outcome="timeout")
+            raise RateLimitTimeout(f"No {self.name} concurrency slot within {timeout}s")
+
+        throttled = False
+        try:
+            if not wait_for_capacity(self.bucket, tokens, deadline=deadline):
+                observe("rate_limit_wait_seconds", time.monotonic() - start, limiter=self.name, outcome="timeout")
+                raise RateLimitTimeout(f"No {self.name} rate limit capacity within {timeout}s")
+            observe("rate_limit_wait_seconds", time.monotonic() - start, limiter=self.name, outcome="ok")
+
+            yield
+        except Exception as e:
+            throttled = is_throttle(e)
+            raise
+        finally:
+            self.concurrency.release(throttled)
@@ -0,0 +1,212 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.models import ConversationLog, Grade, GradeVersion, CaseStudy, RegradeCheckpoint, StudentStats, \
+    GradeDailyRollup
+from .grading import CRITERIA, GRADING_MODE, GRADING_MODEL, GRADING_PROMPT_VERSION, GRADING_RATE_LIMIT_BACKEND, \
+    GRADING_TPM, format_transcript, grade_transcript
+from .logger import logger
+from .ratelimit import create_token_bucket, wait_for_capacity
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+def regrade_run_id(case_study_id: Optional[str], since: Optional[datetime], until: Optional[datetime]) -> str:
+    """
+    Default run id: the same filters under the same prompt resume the same run.
+    """
+    parts = [GRADING_PROMPT_VERSION, case_study_id or "all",
+             since.isoformat() if since else "-", until.isoformat() if until else "-"]
+    return ":".join(parts)
+
+
+def _log_filters(case_study_id: Optional[str], since: Optional[datetime], until: Optional[datetime]) -> dict:
+    filters = {}
+    if case_study_id:
+        filters["case_study"] = ObjectId(case_study_id)
+    if since:
+        filters["timestamp__gte"] = since
+    if until:
+        filters["timestamp__lte"] = until
+    return filters
+
+
+def _grade_update(log: dict, existing: Optional[dict], grading_result: dict, usage: dict,
+                  now: datetime) -> UpdateOne:
+    fields = {
+        "overall_summary": grading_result["overall_summary"],
+        "final_score": grading_result["final_score"],
+        "individual_scores": grading_result["individual_scores"],
+        "performance_summary": grading_result["performance_summary"],
+        "prompt_version": GRADING_PROMPT_VERSION,
+        "model": usage.get("model"),
+        "input_tokens": usage.get("input_tokens"),
+        "output_tokens": usage.get("output_tokens"),
+        "stage_timings": usage.get("stages", {}),
+        "version": (existing.get("version") or 1) + 1 if existing else 1,
+    }
+    on_insert = {"user": log["user"], "case_study": log.get("case_study"), "timestamp": now}
+    return UpdateOne({"conversation_id": log["conversation_id"]}, {"$set": fields, "$setOnInsert": on_insert},
+                     upsert=True)
+
+
+def _archived_version(existing: dict, now: datetime) -> dict:
+    return {
+        "grade": existing["_id"],
+        "conversation_id": existing["conversation_id"],
+        "version": existing.get("version") or 1,
+        "prompt_version": existing.get("prompt_version"),
+        "model": existing.get("model"),
+        "input_tokens": existing.get("input_tokens"),
+        "output_tokens": existing.get("output_tokens"),
+        "stage_timings": existing.get("stage_timings"),
+        "overall_summary": existing.get("overall_summary"),
+        "final_score": existing.get("final_score"),
+        "individual_scores": existing.get("individual_scores"),
+        "performance_summary": existing.get("performance_summary"),
+        "graded_at": existing.get("timestamp"),
+        "archived_at": now,
+    }
+
+
+def _write_batch(updates: list, archived: list):
+    """
+    Archive the superseded versions, then write the new ones. Re-archiving after a crash between the two
+    writes hits the unique (conversation_id, version) index and is ignored.
+    """
+    if archived:
+        try:
+            GradeVersion._get_collection().insert_many(archived, ordered=False)
+        except BulkWriteError as e:
+            if any(error["code"] != DUPLICATE_KEY_ERROR for error in e.details.get("writeErrors", [])):
+                raise
+    if updates:
+        Grade._get_collection().bulk_write(updates, ordered=False)
+
+
+def regrade_logs(case_study_id: str = None, since: datetime = None, until: datetime = None,
+                 concurrency: int = 4, rpm: float = 60, batch_size: int = 50, run_id: str = None,
+                 restart: bool = False, force: bool = False, rebuild: bool = True,
+                 on_progress: Callable = None) -> RegradeCheckpoint:
+    """
+    Regrade the conversation logs matching the filters under the current prompt.
+    Logs are streamed in _id order and graded `batch_size` at a time by `concurrency` threads, at most
+    `rpm` model requests per minute across all regrade processes (0 for no cap), on top of the shared
+    GRADING_RPM limit every model call goes through, so live grading keeps the remaining quota.
+    Each batch's grades are bulk-written as new versions before the checkpoint advances, so a killed run
+    resumes at the first unfinished batch. Conversations already graded under the current prompt are
+    skipped unless `force`, which also bypasses the result cache so they really go back to the model.
+    Results answered from the cache don't count against `rpm`.
+    `on_progress(checkpoint, rate, eta)` is called after every batch, with rate in logs per second.
+    """
+    run_id = run_id or regrade_run_id(case_study_id, since, until)
+    query = ConversationLog.objects(**_log_filters(case_study_id, since, until))
+
+    if restart:
+        RegradeCheckpoint.objects(run_id=run_id).delete()
+    checkpoint = RegradeCheckpoint.objects(run_id=run_id).modify(
+        upsert=True,
+        new=True,
+        set_on_insert__prompt_version=GRADING_PROMPT_VERSION,
+        set_on_insert__filters={"case_study_id": case_study_id, "since": since, "until": until},
+        set_on_insert__started_at=datetime.now(timezone.utc)
+    )
+    checkpoint.total = query.count()
+    checkpoint.save()
+
+    # Only caps regrades; every model call still goes through the shared limiter in grading.generate
+    regrade_bucket = create_token_bucket(GRADING_RATE_LIMIT_BACKEND, f"gemini:{GRADING_MODEL}:regrade", rpm,
+                                         GRADING_TPM) if rpm else None
+    calls_per_grade = 1 if GRADING_MODE == "single" else len(CRITERIA) + 1
+    descriptions = {}
+    started, processed_this_run = time.monotonic(), 0
+
+    def charge_regrade_budget():
+        # Only cache misses spend the regrade budget
+        if regrade_bucket:
+            wait_for_capacity(regrade_bucket, requests=calls_per_grade)
+
+    def grade_log(log: dict, description: str) -> Optional[Tuple[dict, dict]]:
+        transcript = format_transcript(log.get("transcript"))
+        if not any(message["message"] for message in transcript):
+            return None
+        # A forced regrade must reach the model; the cached result is the grade being replaced
+        _, grading_result, usage = grade_transcript(transcript, description, use_cache=not force,
+                                                    before_model_call=charge_regrade_budget)
+        return grading_result, usage
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="regrade") as pool:
+        while True:
+            batch_query = query.filter(id__gt=checkpoint.last_id) if checkpoint.last_id else query
+            logs = list(batch_query.order_by('id').only('id', 'user', 'case_study', 'conversation_id',
+                                                        'transcript').limit(batch_size).as_pymongo())
+            if not logs:
+                break
+
+            existing = {
+                grade["conversation_id"]: grade
+                for grade in Grade.objects(conversation_id__in=[log["conversation_id"] for log in logs]).as_pymongo()
+            }
+            todo = [
+                log for log in logs
+                if force or existing.get(log["conversation_id"], {}).get("prompt_version") != GRADING_PROMPT_VERSION
+            ]
+
+            missing = {log.get("case_study") for log in todo} - set(descriptions)
+            if missing:
+                for case in CaseStudy.objects(id__in=[cid for cid in missing if cid]).only('description').as_pymongo():
+                    descriptions[case["_id"]] = case.get("description")
+
+            futures = [(log, pool.submit(grade_log, log, descriptions.get(log.get("case_study"), "")))
+                       for log in todo]
+
+            now = datetime.now(timezone.utc)
+            updates, archived, failed, skipped = [], [], 0, len(logs) - len(todo)
+            for log, future in futures:
+                try:
+                    graded = future.result()
+                except Exception as e:
+                    logger.error(f"Error in regrade of conversation {log['conversation_id']}: {str(e)}")
+                    failed += 1
+                    continue
+                if graded is None:
+                    skipped += 1
+                    continue
+
+                previous = existing.get(log["conversation_id"])
+                updates.append(_grade_update(log, previous, *graded, now))
+                if previous:
+                    archived.append(_archived_version(previous, now))
+
+            _write_batch(updates, archived)
+
+            checkpoint = RegradeCheckpoint.objects(id=checkpoint.id).modify(
+                new=True,
+                set__last_id=logs[-1]["_id"],
+                set__updated_at=now,
+                inc__processed=len(logs),
+                inc__regraded=len(updates),
+                inc__skipped=skipped,
+                inc__failed=failed
+            )
+
+            processed_this_run += len(logs)
+            rate = processed_this_run / max(time.monotonic() - started, 1e-9)
+            eta = max(checkpoint.total - checkpoint.processed, 0) / rate if rate else None
+            if on_progress:
+                on_progress(checkpoint, rate, eta)
+
+    if rebuild and checkpoint.regraded:
+        # Scores changed in place, so the denormalized stats and rollups are recomputed from scratch
+        StudentStats.rebuild()
+        GradeDailyRollup.rebuild()
+
+    checkpoint = RegradeCheckpoint.objects(id=checkpoint.id).modify(new=True,
+                                                                    set__finished_at=datetime.now(timezone.utc))
+    return checkpoint
@@ -0,0 +1,73 @@
+import bisect
+import threading
+from typing import Dict, Tuple
+
+# Upper bounds in seconds, spanning fast database calls to slow LLM generations.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+
+class Histogram:
+    """
+    Thread-safe cumulative histogram of observed values, in the style of a Prometheus histogram.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the bucket holding the q-quantile (inf when it falls past the last bucket).
+        """
+        with self._lock:
+            if not self.count:
+                return 0.0
+            rank = q * self.count
+            seen = 0
+            for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+                seen += count
+                if seen >= rank:
+                    return bound
+            return float("inf")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            cumulative, buckets = 0, {}
+            for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+                cumulative += count
+                buckets[str(bound)] = cumulative
+            return {"count": self.count, "sum": self.sum, "buckets": buckets}
+
+
+_histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Histogram] = {}
+_lock = threading.Lock()
+
+
+def histogram(name: str, **labels) -> Histogram:
+    key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+    with _lock:
+        if key not in _histograms:
+            _histograms[key] = Histogram()
+        return _histograms[key]
+
+
+def observe(name: str, value: float, **labels):
+    """
+    Record a value, e.g. observe("elevenlabs_request_seconds", 0.42, endpoint="conversation", outcome="ok").
+    """
+    histogram(name, **labels).observe(value)
+
+
+def snapshot() -> list:
+    with _lock:
+        items = list(_histograms.items())
+    return [{"name": name, "labels": dict(labels), **hist.snapshot()} for (name, labels), hist in items]
@@ -0,0 +1,114 @@
+import os
+import re
+import threading
+from typing import List, Tuple
+
+from .logger import logger
+
+TRANSCRIPT_TOKEN_BUDGET = int(os.getenv("GRADING_TRANSCRIPT_TOKEN_BUDGET", 24000))
+# "middle" keeps the opening and the latest turns, "end" keeps the opening turns only
+TRANSCRIPT_OVERFLOW_POLICY = os.getenv("GRADING_TRANSCRIPT_OVERFLOW_POLICY", "middle")
+TRANSCRIPT_ENCODING = os.getenv("GRADING_TRANSCRIPT_ENCODING", "cl100k_base")
+
+ROLE_LABELS = {"user": "User", "agent": "Professional"}
+# Turns that carry no content. Short answers like "yes" or "no" are kept: they may answer a question.
+FILLER_TURNS = {"", "um", "umm", "uh", "uhh", "er", "erm", "ah", "hmm", "hm", "mm", "mhm", "mm hmm", "uh huh", "..."}
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    global _encoding
+    with _encoding_lock:
+        if _encoding is None:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding(TRANSCRIPT_ENCODING)
+            except Exception as e:
+                logger.warning(f"tiktoken unavailable, estimating tokens from length: {str(e)}")
+                _encoding = False
+        return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """
+    Token count of `text` under the tiktoken encoding; roughly 4 characters per token without it.
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def _is_filler(message: str) -> bool:
+    return re.sub(r"[^\w\s.]", "", message.lower()).strip(" .") in FILLER_TURNS
+
+
+def compact_turns(formatted_transcript: list) -> List[str]:
+    """
+    Render {"role", "message"} turns as "Role: text" lines, with whitespace collapsed, empty and
+    filler turns dropped and consecutive turns by the same speaker merged.
+    """
+    turns, last_role = [], None
+    for message in formatted_transcript or []:
+        text = " ".join(str(message.get("message") or "").split())
+        if _is_filler(text):
+            continue
+        role = ROLE_LABELS.get(str(message.get("role") or "").lower(), str(message.get("role") or "Unknown"))
+        if role == last_role:
+            turns[-1] = f"{turns[-1]} {text}"
+        else:
+            turns.append(f"{role}: {text}")
+        last_role = role
+    return turns
+
+
+def _fit_turns(turns: List[str], counts: List[int], budget: int, policy: str) -> List[str]:
+    marker_tokens = 16
+    if policy == "end":
+        kept, used = [], 0
+        for turn, count in zip(turns, counts):
+            if used + count > budget - marker_tokens:
+                break
+            kept.append(turn)
+            used += count
+        return kept + [f"[... {len(turns) - len(kept)} later turns omitted ...]"]
+
+    # Alternate between the start and the end so both the framing questions and the conclusion survive
+    head, tail, used = [], [], 0
+    i, j = 0, len(turns) - 1
+    take_head = True
+    while i <= j:
+        index = i if take_head else j
+        if used + counts[index] > budget - marker_tokens:
+            break
+        used += counts[index]
+        if take_head:
+            head.append(turns[i])
+            i += 1
+        else:
+            tail.append(turns[j])
+            j -= 1
+        take_head = not take_head
+    return head + [f"[... {j - i + 1} turns omitted ...]"] + tail[::-1]
+
+
+def compact_transcript(formatted_transcript: list, budget: int = None, policy: str = None) -> Tuple[str, int]:
+    """
+    Compact rendering of a transcript for the grading prompt, held to `budget` tokens
+    (default GRADING_TRANSCRIPT_TOKEN_BUDGET) by the overflow `policy`. Returns (text, token count).
+    """
+    budget = budget or TRANSCRIPT_TOKEN_BUDGET
+    policy = policy or TRANSCRIPT_OVERFLOW_POLICY
+
+    turns = compact_turns(formatted_transcript)
+    counts = [count_tokens(turn) + 1 for turn in turns]
+    if sum(counts) > budget:
+        logger.info(f"Transcript of {sum(counts)} tokens exceeds the {budget} token budget; applying '{policy}'")
+        turns = _fit_turns(turns, counts, budget, policy)
+
+    text = "\n".join(turns)
+    return text, count_tokens(text)
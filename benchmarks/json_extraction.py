@@ -0,0 +1,82 @@
+"""
+Compare the previous JSON extraction fallback with the linear scanner on model-sized responses.
+
+Usage:
+    python -m benchmarks.json_extraction [--items 200] [--repeat 5]
+
+The previous implementation retried raw_decode from every "{", so it is quadratic on long malformed
+responses and recurses without bound on deep nesting; the pathological cases show the difference,
+the well-formed ones check nothing regressed.
+"""
+import argparse
+import json
+import timeit
+
+from app.utils.perser import extract_json
+
+
+def legacy_extract_json(s, index=0):
+    """
+    The extract_json this scanner replaced, kept here as the baseline.
+    """
+    def raw_json_decoder(start):
+        class _RawJSONDecoder(json.JSONDecoder):
+            end = None
+
+            def decode(self, s, *_):
+                data, self.__class__.end = self.raw_decode(s, start)
+                return data
+
+        return _RawJSONDecoder
+
+    while (index := s.find('{', index)) != -1:
+        try:
+            yield json.loads(s, cls=(decoder := raw_json_decoder(index)))
+            index = decoder.end
+        except json.JSONDecodeError:
+            index += 1
+
+
+def make_report(items: int) -> dict:
+    item = {"title": "Clear communication", "description": "You structured your answers well. " * 8}
+    return {
+        "overall_summary": "Your analysis covered the main stakeholders. " * 20,
+        "final_score": 72,
+        "individual_scores": {"critical_thinking": 70, "comprehension": 75, "communication": 72},
+        "performance_summary": {"strengths": [item] * items, "weaknesses": [item] * items},
+    }
+
+
+def make_cases(items: int) -> dict:
+    report = json.dumps(make_report(items))
+    return {
+        "wrapped": f"Here is the grade:\n```json\n{report}\n```\nLet me know if you need more.",
+        # Cut off mid-generation: no complete object anywhere
+        "truncated": report[: len(report) // 2],
+        # Every brace opens an object that never parses
+        "brace_noise": "{" * (len(report) // 4) + report,
+        "nested_unclosed": '{"a": ' * (len(report) // 12) + "1",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=200, help="Strengths and weaknesses per report.")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for name, text in make_cases(args.items).items():
+        linear = min(timeit.repeat(lambda: next(extract_json(text), None), number=1, repeat=args.repeat))
+        try:
+            assert next(legacy_extract_json(text), None) == next(extract_json(text), None), \
+                f"{name}: implementations disagree"
+            legacy = min(timeit.repeat(lambda: next(legacy_extract_json(text), None), number=1, repeat=args.repeat))
+        except RecursionError:
+            print(f"{name:>16} ({len(text):>8} chars): legacy   RecursionError, linear {linear * 1000:7.1f} ms")
+            continue
+        print(f"{name:>16} ({len(text):>8} chars): legacy {legacy * 1000:9.1f} ms, "
+              f"linear {linear * 1000:7.1f} ms, speedup {legacy / linear:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Compare the hydrated MongoEngine read path with the raw-document path for grade payloads.
+
+Usage:
+    python -m benchmarks.read_paths [--grades 2000] [--repeat 5]
+
+Both paths start from the same raw BSON-shaped documents, so the numbers isolate the CPU spent
+turning a grade history into response payloads, which is what dominates on large histories.
+"""
+import argparse
+import os
+import random
+import timeit
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+
+# Importing the app package connects lazily; make sure it can be imported on an offline box.
+for var in ("MONGO_URI", "JWT_SECRET", "ELEVENLABS_API_KEY", "GOOGLE_API_KEY"):
+    os.environ.setdefault(var, "mongodb://localhost:27017" if var == "MONGO_URI" else "benchmark")
+os.environ.setdefault("MONGO_SYNC_INDEXES", "false")
+
+from app.models import Grade  # noqa: E402
+from app.serializers import GradeRecord, serialize_grade, serialize_grade_report  # noqa: E402
+
+
+def make_raw_grades(count: int) -> list:
+    user_id, case_study_id = ObjectId(), ObjectId()
+    now = datetime.now(timezone.utc)
+    item = {"title": "Clear communication", "description": "You structured your answers well. " * 8}
+    return [
+        {
+            "_id": ObjectId(),
+            "user": user_id,
+            "case_study": case_study_id,
+            "conversation_id": f"conv_{i}",
+            "overall_summary": "Your analysis covered the main stakeholders. " * 10,
+            "final_score": random.randint(0, 100),
+            "individual_scores": {
+                "critical_thinking": random.randint(0, 100),
+                "comprehension": random.randint(0, 100),
+                "communication": random.randint(0, 100),
+            },
+            "performance_summary": {"strengths": [item] * 3, "weaknesses": [item] * 3},
+            "timestamp": now - timedelta(minutes=i),
+        }
+        for i in range(count)
+    ]
+
+
+def hydrated_path(raws: list) -> list:
+    grades = [Grade._from_son(raw) for raw in raws]
+    return [(serialize_grade(grade, "student@example.com"), serialize_grade_report(grade)) for grade in grades]
+
+
+def raw_path(raws: list) -> list:
+    grades = [GradeRecord(raw) for raw in raws]
+    return [(serialize_grade(grade, "student@example.com"), serialize_grade_report(grade)) for grade in grades]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--grades", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    raws = make_raw_grades(args.grades)
+    assert hydrated_path(raws[:10]) == raw_path(raws[:10]), "paths must produce identical payloads"
+
+    results = {}
+    for name, path in (("hydrated", hydrated_path), ("raw", raw_path)):
+        results[name] = min(timeit.repeat(lambda: path(raws), number=1, repeat=args.repeat))
+        print(f"{name:>9}: {results[name] * 1000:8.1f} ms for {args.grades} grades "
+              f"({results[name] / args.grades * 1e6:6.1f} us/grade)")
+
+    print(f"  speedup: {results['hydrated'] / results['raw']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+import os
+
+# Importing `app` builds the Flask app, which requires these; pymongo connects lazily so no server is needed
+os.environ.setdefault("MONGO_URI", "mongodb://127.0.0.1:27017/ailp-test")
+os.environ.setdefault("MONGO_SYNC_INDEXES", "false")
+os.environ.setdefault("JWT_SECRET", "test-secret")
+os.environ.setdefault("ELEVENLABS_API_KEY", "test-key")
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
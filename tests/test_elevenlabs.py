@@ -0,0 +1,178 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from app.utils.elevenlabs import CircuitBreaker, CircuitOpenError, ElevenLabsClient
+
+CONVERSATION_PATH = "/convai/conversations/conv-1"
+
+
+class FakeElevenLabs(ThreadingHTTPServer):
+    """
+    Local stand-in for the ElevenLabs API. Each request takes the next scripted (status, body, delay)
+    response; once the script runs out every request gets a 200.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeHandler)
+        self.script = []
+        self.received = []
+        self.request_started = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def respond(self, *responses):
+        self.script.extend(responses)
+
+    def next_response(self, handler) -> tuple:
+        with self._lock:
+            self.received.append({"path": handler.path, "headers": dict(handler.headers)})
+            response = self.script.pop(0) if self.script else (200, {"status": "done"}, 0)
+        self.request_started.set()
+        return response
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        status, body, delay = self.server.next_response(self)
+        time.sleep(delay)
+        payload = json.dumps(body).encode()
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client timed out and went away
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def upstream():
+    server = FakeElevenLabs()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_client(upstream, **kwargs) -> ElevenLabsClient:
+    options = {"backoff_factor": 0, "max_retries": 3, "read_timeout": 2}
+    options.update(kwargs)
+    return ElevenLabsClient("test-key", base_url=upstream.url, **options)
+
+
+@pytest.mark.parametrize("status", [429, 500, 502, 503, 504])
+def test_retries_overload_and_server_errors(upstream, status):
+    upstream.respond((status, {"detail": "busy"}, 0), (status, {"detail": "busy"}, 0), (200, {"status": "done"}, 0))
+    client = make_client(upstream)
+
+    assert client.get_conversation("conv-1") == {"status": "done"}
+    assert len(upstream.received) == 3
+    assert all(r["path"] == CONVERSATION_PATH for r in upstream.received)
+    assert upstream.received[0]["headers"]["Xi-Api-Key"] == "test-key"
+    assert client.breaker.state == "closed"
+
+
+def test_gives_up_after_max_retries(upstream):
+    upstream.respond(*[(503, {"detail": "unavailable"}, 0)] * 3)
+    client = make_client(upstream, max_retries=2)
+
+    with pytest.raises(requests.HTTPError):
+        client.get_conversation("conv-1")
+    assert len(upstream.received) == 3
+    assert client.breaker.failures == 1
+
+
+def test_client_errors_are_not_retried(upstream):
+    upstream.respond((404, {"detail": "not found"}, 0))
+    client = make_client(upstream)
+
+    with pytest.raises(requests.HTTPError):
+        client.get_conversation("conv-1")
+    assert len(upstream.received) == 1
+    assert client.breaker.failures == 0
+
+
+def test_read_timeout_is_retried_then_raised(upstream):
+    upstream.respond((200, {"status": "done"}, 1.0), (200, {"status": "done"}, 1.0))
+    client = make_client(upstream, read_timeout=0.2, max_retries=1)
+
+    start = time.monotonic()
+    # With a retry policy, urllib3 reports the exhausted read timeout through requests as a ConnectionError
+    with pytest.raises(requests.RequestException, match="Read timed out"):
+        client.get_conversation("conv-1")
+    assert time.monotonic() - start < 0.9
+    assert len(upstream.received) == 2
+    assert client.breaker.failures == 1
+
+
+def test_slow_response_within_read_timeout(upstream):
+    upstream.respond((200, {"status": "done"}, 0.2))
+    client = make_client(upstream, read_timeout=1, max_retries=0)
+
+    assert client.get_conversation("conv-1") == {"status": "done"}
+    assert len(upstream.received) == 1
+
+
+def test_breaker_opens_and_allows_one_half_open_trial(upstream):
+    upstream.respond((503, {}, 0), (503, {}, 0))
+    client = make_client(upstream, max_retries=0, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=0.3))
+
+    for _ in range(2):
+        with pytest.raises(requests.HTTPError):
+            client.get_conversation("conv-1")
+    assert client.breaker.state == "open"
+
+    # Open: fails fast without reaching upstream
+    with pytest.raises(CircuitOpenError):
+        client.get_conversation("conv-1")
+    assert len(upstream.received) == 2
+
+    time.sleep(0.35)
+    assert client.breaker.state == "half_open"
+
+    # Half open: one slow trial goes through, concurrent calls still fail fast
+    upstream.respond((200, {"status": "done"}, 0.3))
+    upstream.request_started.clear()
+    trial = {}
+    thread = threading.Thread(target=lambda: trial.update(result=client.get_conversation("conv-1")))
+    thread.start()
+    assert upstream.request_started.wait(2)
+
+    with pytest.raises(CircuitOpenError):
+        client.get_conversation("conv-1")
+    thread.join(2)
+
+    assert trial["result"] == {"status": "done"}
+    assert len(upstream.received) == 3
+    assert client.breaker.state == "closed"
+    assert client.get_conversation("conv-1") == {"status": "done"}
+
+
+def test_failed_half_open_trial_reopens(upstream):
+    upstream.respond((503, {}, 0), (503, {}, 0))
+    client = make_client(upstream, max_retries=0, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0.2))
+
+    with pytest.raises(requests.HTTPError):
+        client.get_conversation("conv-1")
+    time.sleep(0.25)
+
+    with pytest.raises(requests.HTTPError):
+        client.get_conversation("conv-1")
+    assert client.breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        client.get_conversation("conv-1")
+    assert len(upstream.received) == 2
@@ -0,0 +1,69 @@
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.utils import grading
+from app.utils.hedging import HedgeLimiter
+from app.utils.local_grader import LocalGrader
+from app.utils.ratelimit import AdaptiveConcurrency, LocalTokenBucket, RateLimiter
+
+TRANSCRIPT = [{"role": "user", "message": "Hello"}, {"role": "agent", "message": "Hi, how can I help?"}]
+
+
+class FakeModels:
+    """
+    Answers generate_content with a valid report. The first call is slow, so it gets hedged, and the
+    hedge answers first; each attempt reports its own token usage.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.primary_done = threading.Event()
+        self._lock = threading.Lock()
+
+    def generate_content(self, model, contents, config):
+        with self._lock:
+            self.calls += 1
+            attempt = self.calls
+        if attempt == 1:
+            time.sleep(0.3)
+            self.primary_done.set()
+        usage = SimpleNamespace(prompt_token_count=1000, candidates_token_count=100 * attempt)
+        return SimpleNamespace(text=json.dumps(LocalGrader.report("transcript")), usage_metadata=usage)
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    models = FakeModels()
+    monkeypatch.setattr(grading, "get_client", lambda: SimpleNamespace(models=models))
+    monkeypatch.setattr(grading, "grader", grading.GeminiGrader())
+    monkeypatch.setattr(grading, "GRADING_CONTEXT_CACHE", False)
+    monkeypatch.setattr(grading, "model_limiter",
+                        RateLimiter("test", LocalTokenBucket(10 ** 6, 10 ** 9), AdaptiveConcurrency()))
+    monkeypatch.setattr(grading, "hedge_limiter", HedgeLimiter())
+    monkeypatch.setattr(grading, "hedge_delay", lambda call: 0.05)
+    return models
+
+
+def test_usage_counts_only_the_answering_attempt(gemini):
+    _, result, usage = grading.grade_transcript(TRANSCRIPT, "case study", use_cache=False, mode="single")
+    # Let the abandoned primary finish too: its tokens must still not be counted
+    assert gemini.primary_done.wait(2)
+
+    assert gemini.calls == 2
+    assert [(t["hedge"], t.get("won", False)) for t in usage["calls"]] == [(True, True)]
+    assert usage["input_tokens"] == 1000
+    assert usage["output_tokens"] == 200
+    assert usage["cached"] is False
+    assert result["final_score"] == grading.weighted_score(result["individual_scores"])
+
+
+def test_before_model_call_runs_before_the_model_is_called(gemini):
+    charged = []
+    grading.grade_transcript(TRANSCRIPT, "case study", use_cache=False, mode="single",
+                             before_model_call=lambda: charged.append(gemini.calls))
+
+    assert charged == [0]
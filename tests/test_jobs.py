@@ -0,0 +1,62 @@
+import threading
+import time
+
+from app.models import JobStatus
+from app.utils.jobs import LocalJobQueue, WorkerPool
+
+
+def enqueue(queue):
+    return queue.enqueue(conversation_id="conv-1", user_email="student@example.com", case_study_id="case-1")
+
+
+def test_heartbeat_keeps_a_long_job_claimed():
+    queue = LocalJobQueue(visibility_timeout=0.3)
+    job = enqueue(queue)
+    started = threading.Event()
+
+    def handler(job, report):
+        started.set()
+        time.sleep(0.8)  # Well past the visibility timeout, without reporting progress
+        return "graded"
+
+    pool = WorkerPool(queue, handler, concurrency=1)
+    worker = threading.Thread(target=pool.run_once, args=("worker-1",))
+    worker.start()
+    assert started.wait(1)
+
+    time.sleep(0.5)
+    assert queue.claim("worker-2") is None
+    worker.join(2)
+
+    assert job.status == JobStatus.SUCCEEDED
+    assert job.attempts == 1
+    assert job.result == "graded"
+
+
+def test_heartbeat_stops_when_the_job_finishes():
+    queue = LocalJobQueue(visibility_timeout=0.3)
+    job = enqueue(queue)
+    pool = WorkerPool(queue, lambda job, report: "graded", concurrency=1)
+
+    assert pool.run_once("worker-1")
+    progress, updated_at = job.progress, job.updated_at
+    time.sleep(0.3)
+
+    assert job.status == JobStatus.SUCCEEDED
+    assert (job.progress, job.updated_at) == (progress, updated_at)
+
+
+def test_stale_owner_cannot_finish_a_reclaimed_job():
+    queue = LocalJobQueue(visibility_timeout=0.05, retry_backoff=0)
+    job = enqueue(queue)
+    stale = queue.claim("worker-1")
+    time.sleep(0.1)
+    current = queue.claim("worker-2")
+
+    assert not queue.heartbeat(stale, "grading")
+    assert not queue.complete(stale, "stale result")
+    assert not queue.fail(stale, "stale error")
+    assert (job.status, job.worker, job.attempts) == (JobStatus.RUNNING, "worker-2", 2)
+
+    assert queue.complete(current, "graded")
+    assert (job.status, job.result) == (JobStatus.SUCCEEDED, "graded")
@@ -0,0 +1,68 @@
+import time
+
+import pytest
+
+from app.utils.ratelimit import AdaptiveConcurrency, LocalTokenBucket, RateLimiter, RateLimitTimeout, \
+    wait_for_capacity
+
+
+class CountingBucket(LocalTokenBucket):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.attempts = 0
+
+    def try_take(self, tokens, requests=1):
+        self.attempts += 1
+        return super().try_take(tokens, requests)
+
+
+def test_bucket_charges_requests_and_tokens():
+    bucket = LocalTokenBucket(rpm=60, tpm=1000)
+
+    assert bucket.try_take(600) == 0
+    # One request left to pay for, but only ~400 tokens: waits for the token refill
+    assert bucket.try_take(600) == pytest.approx(12, abs=0.1)
+    assert bucket.try_take(0, requests=60) == pytest.approx(1, abs=0.1)
+
+
+def test_waiting_caller_sleeps_for_the_reported_wait():
+    bucket = CountingBucket(600, 10 ** 9)  # One request every 0.1s
+    for _ in range(600):
+        bucket.try_take(0)
+    bucket.attempts = 0
+
+    start = time.monotonic()
+    assert wait_for_capacity(bucket, requests=3)
+    elapsed = time.monotonic() - start
+
+    assert 0.3 <= elapsed < 0.6
+    assert bucket.attempts <= 3
+
+
+def test_wait_gives_up_at_the_deadline():
+    bucket = LocalTokenBucket(rpm=1, tpm=10 ** 9)
+    bucket.try_take(0)
+
+    start = time.monotonic()
+    assert not wait_for_capacity(bucket, deadline=start + 0.2)
+    assert time.monotonic() - start < 0.1
+
+
+def test_limiter_times_out_and_backs_off_on_throttling():
+    concurrency = AdaptiveConcurrency(initial=4, cooldown=0)
+    limiter = RateLimiter("test", LocalTokenBucket(rpm=1, tpm=10 ** 9), concurrency)
+    with limiter.limit():
+        pass
+    with pytest.raises(RateLimitTimeout):
+        with limiter.limit(timeout=0.1):
+            pass
+
+    class Throttled(Exception):
+        code = 429
+
+    limiter.bucket = LocalTokenBucket(rpm=600, tpm=10 ** 9)
+    with pytest.raises(Throttled):
+        with limiter.limit():
+            raise Throttled()
+    assert concurrency.limit < 4
+    assert concurrency.in_flight == 0